@@ -1,7 +1,35 @@
-from .kmeans import KMeans
-from .silhouette import Silhouette
-from .utils import (
-        make_clusters, 
-        plot_clusters,
-        plot_multipanel)
+import importlib
 
+'''
+the names below are imported from their module on first use (PEP 562), so `import cluster` is fast and
+fitting or predicting never loads matplotlib (only the plotting functions do). scipy is only loaded by
+the code that needs it, see cluster/distance.py.
+'''
+
+_LAZY = {
+        "KMeans": ".kmeans",
+        "KMeansWorkspace": ".kmeans",
+        "KMeansPredictor": ".predictor",
+        "Silhouette": ".silhouette",
+        "KMeansSweep": ".sweep",
+        "select_k": ".sweep",
+        "load_matrix": ".io",
+        "make_clusters": ".utils",
+        "iter_clusters": ".utils",
+        "plot_clusters": ".utils",
+        "plot_multipanel": ".utils"}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+    #cached as a normal module attribute, later lookups do not come here again
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tracemalloc
+import numpy as np
+from .kmeans import KMeans
+from .silhouette import Silhouette
+from .utils import make_clusters
+
+'''
+benchmarks for the clustering code. run_grid() times fit, predict, get_error and Silhouette.score on a
+grid of generated datasets and records the peak memory and number of iterations. the results are plain
+json, so a run can be saved as a baseline and later runs compared against it:
+
+    python -m cluster.benchmark --grid small --output baseline.json
+    python -m cluster.benchmark --grid small --baseline baseline.json
+
+the second command exits with status 1 if anything got slower or uses more memory than the tolerance
+allows. `python -m cluster.benchmark --algorithms` compares the lloyd/elkan/hamerly distance counts.
+
+timings are the best of `repeat` runs (the minimum is the least noisy estimate of the true cost). the
+peak memory is measured in an extra run under tracemalloc, which slows the code down and would
+distort the timings. it counts the memory numpy allocates, not the input data that already exists.
+'''
+
+#(n, m, k, scale) grids, every combination is one benchmark case
+GRIDS = {
+    "small": {"n": [2000, 10000], "m": [2, 16], "k": [4, 16], "scale": [1.0]},
+    "medium": {"n": [10000, 100000], "m": [2, 16, 64], "k": [8, 64], "scale": [1.0, 3.0]},
+    "large": {"n": [100000, 1000000], "m": [16, 128], "k": [16, 256], "scale": [2.0]},
+}
+
+#the exact silhouette is O(n^2), larger cases skip it
+SILHOUETTE_MAX_N = 20000
+
+def compare_algorithms(
+        n: int = 20000,
+        m: int = 10,
+        k: int = 20,
+        scale: float = 2,
+        max_iter: int = 300,
+        seed: int = 42) -> dict:
+    """
+    fits the same clustered data with every KMeans algorithm and reports how many point to centroid
+    distances each one computed.
+
+    inputs:
+        n: int
+            number of observations
+        m: int
+            number of features
+        k: int
+            number of clusters (used both to generate the data and to fit it)
+        scale: float
+            standard deviation of the generated clusters
+        max_iter: int
+            the maximum number of iterations of each fit
+        seed: int
+            random seed for the generated data
+
+    outputs:
+        dict
+            maps every algorithm to a dict with its `n_distance_evals`, the fraction of
+            distance evaluations `saved` compared to lloyd, the fit `time` in seconds and whether
+            its labels and centroids are `identical` to the lloyd result
+    """
+    mat, _ = make_clusters(n=n, m=m, k=k, scale=scale, seed=seed)
+
+    results = {}
+    reference = None
+    for algorithm in ["lloyd", "elkan", "hamerly"]:
+        km = KMeans(k=k, max_iter=max_iter, algorithm=algorithm)
+        start = time.perf_counter()
+        km.fit(mat)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = km
+        results[algorithm] = {
+            "n_distance_evals": km.n_distance_evals_,
+            "saved": 1 - km.n_distance_evals_ / reference.n_distance_evals_,
+            "time": elapsed,
+            "identical": bool(
+                np.array_equal(km.labels, reference.labels) and
+                np.array_equal(km.centroids, reference.centroids)),
+        }
+    return results
+
+
+def _measure(func, repeat: int) -> dict:
+    """
+    returns the best `time` of `repeat` calls of `func` in seconds and the `peak_memory` in bytes
+    allocated during one more call
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"time": min(times), "peak_memory": peak}
+
+
+def run_case(
+        n: int,
+        m: int,
+        k: int,
+        scale: float,
+        repeat: int = 3,
+        seed: int = 42,
+        silhouette_max_n: int = SILHOUETTE_MAX_N,
+        **kmeans_params) -> dict:
+    """
+    benchmarks one dataset of `n` observations with `m` features in `k` clusters of standard deviation
+    `scale`, fitted with KMeans(k=k, **kmeans_params).
+
+    outputs:
+        dict
+            the case parameters plus a `fit`, `predict`, `get_error` and `silhouette` dict with `time`
+            and `peak_memory` (`silhouette` is None above `silhouette_max_n` observations). `fit` also
+            holds the number of iterations `n_iter` and the `inertia`
+    """
+    mat, _ = make_clusters(n=n, m=m, k=k, scale=scale, seed=seed)
+    km = KMeans(k=k, **kmeans_params)
+
+    result = {"n": n, "m": m, "k": k, "scale": scale}
+    result["fit"] = _measure(lambda: km.fit(mat), repeat)
+    result["fit"]["n_iter"] = km.n_iter_
+    result["fit"]["inertia"] = km.inertia_
+    result["predict"] = _measure(lambda: km.predict(mat), repeat)
+    result["get_error"] = _measure(km.get_error, repeat)
+    result["silhouette"] = None
+    if n <= silhouette_max_n:
+        result["silhouette"] = _measure(lambda: Silhouette().score(mat, km.labels), repeat)
+    return result
+
+
+def run_grid(grid="small", repeat: int = 3, seed: int = 42, verbose: bool = False, **params) -> dict:
+    """
+    runs run_case() for every (n, m, k, scale) combination of `grid`
+
+    inputs:
+        grid: str or dict
+            the name of one of the GRIDS or a dict with lists of `n`, `m`, `k` and `scale`
+        repeat: int
+            number of timed runs per measurement
+        seed: int
+            random seed for the generated data
+        verbose: bool
+            print every case when it is done
+        params:
+            passed on to run_case (silhouette_max_n and KMeans parameters)
+
+    outputs:
+        dict
+            `environment` (python, numpy, platform, cpu count) and the list of `cases`
+    """
+    if isinstance(grid, str):
+        if grid not in GRIDS:
+            raise ValueError(f"grid must be one of {sorted(GRIDS)} or a dict.")
+        grid = GRIDS[grid]
+    if sorted(grid) != ["k", "m", "n", "scale"]:
+        raise ValueError("a grid needs lists of 'n', 'm', 'k' and 'scale'.")
+
+    cases = []
+    for n, m, k, scale in itertools.product(grid["n"], grid["m"], grid["k"], grid["scale"]):
+        cases.append(run_case(n, m, k, scale, repeat=repeat, seed=seed, **params))
+        if verbose:
+            print(_format_case(cases[-1]), flush=True)
+
+    environment = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    return {"environment": environment, "cases": cases}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2, min_time: float = 1e-3) -> list:
+    """
+    compares two run_grid() results case by case. a measurement counts as a regression if its time or
+    peak memory is more than `tolerance` (relative) above the baseline. times below `min_time` seconds
+    count as `min_time`, sub-millisecond timings are mostly noise. cases that are only in one of the
+    two are ignored.
+
+    outputs:
+        list
+            one dict per regression with the case, `operation`, `metric`, `baseline`, `value` and `ratio`
+    """
+    def key(case):
+        return (case["n"], case["m"], case["k"], case["scale"])
+
+    baseline_cases = {key(case): case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        before = baseline_cases.get(key(case))
+        if before is None:
+            continue
+        for operation in ("fit", "predict", "get_error", "silhouette"):
+            if case[operation] is None or before[operation] is None:
+                continue
+            for metric in ("time", "peak_memory"):
+                old, new = before[operation][metric], case[operation][metric]
+                if metric == "time":
+                    old, new = max(old, min_time), max(new, min_time)
+                if new > old * (1 + tolerance):
+                    regressions.append({
+                        "n": case["n"], "m": case["m"], "k": case["k"], "scale": case["scale"],
+                        "operation": operation,
+                        "metric": metric,
+                        "baseline": old,
+                        "value": new,
+                        "ratio": new / old if old > 0 else float("inf"),
+                    })
+    return regressions
+
+
+def save_results(results: dict, path: str):
+    """
+    writes run_grid() results as json
+    """
+    with open(path, "w") as handle:
+        json.dump(results, handle, indent=2)
+
+
+def load_results(path: str) -> dict:
+    """
+    reads results written by save_results()
+    """
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _format_case(case: dict) -> str:
+    """
+    one line summary of a run_case() result
+    """
+    parts = [f"n={case['n']:>8} m={case['m']:>4} k={case['k']:>4} scale={case['scale']}"]
+    for operation in ("fit", "predict", "get_error", "silhouette"):
+        if case[operation] is not None:
+            parts.append(
+                f"{operation} {case[operation]['time']:.4f}s/{case[operation]['peak_memory'] / 2**20:.1f}MB")
+    parts.append(f"{case['fit']['n_iter']} iterations")
+    return ", ".join(parts)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="benchmarks for KMeans and Silhouette")
+    parser.add_argument("--grid", default="small", choices=sorted(GRIDS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative increase (default 0.2)")
+    parser.add_argument("--algorithm", default="lloyd", choices=["lloyd", "elkan", "hamerly"])
+    parser.add_argument("--algorithms", action="store_true", help="only compare the distance counts of the algorithms")
+    args = parser.parse_args(argv)
+
+    if args.algorithms:
+        for algorithm, result in compare_algorithms().items():
+            print(
+                f"{algorithm:>8}: {result['n_distance_evals']:>12,d} distance evaluations "
+                f"({result['saved']:6.1%} saved), {result['time']:.3f}s, "
+                f"identical to lloyd: {result['identical']}")
+        return 0
+
+    results = run_grid(args.grid, repeat=args.repeat, verbose=True, algorithm=args.algorithm)
+    if args.output:
+        save_results(results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(
+                f"REGRESSION n={regression['n']} m={regression['m']} k={regression['k']} "
+                f"scale={regression['scale']}: {regression['operation']} {regression['metric']} "
+                f"{regression['baseline']:.4g} -> {regression['value']:.4g} ({regression['ratio']:.2f}x)")
+        if regressions:
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
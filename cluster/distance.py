@@ -0,0 +1,180 @@
+import numpy as np
+
+'''
+euclidean distances through the expansion ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2.
+the x.c part of all pairs is a single matrix product, which numpy hands to BLAS, so this is a lot
+faster than cdist (which loops over every pair) and works the same in float32 and float64.
+
+accuracy: the product x.c of m features is off by at most m * eps * ||x|| * ||c|| (eps is the machine
+epsilon of the dtype, 1.2e-7 for float32 and 2.2e-16 for float64) and the norms and the two additions
+add a few eps more, so every squared distance is within
+
+    (2m + 6) * eps * (||x||^2 + ||c||^2)
+
+of the exact value. the error is absolute, so small distances between points far from the origin
+lose the most digits (centering the data first helps). labels only depend on which centroid is
+closest, so assign_labels() recomputes the rows where the two closest centroids are within twice
+that bound of each other exactly with cdist in float64, and its labels are always the exact ones.
+'''
+
+def cdist(XA: np.ndarray, XB: np.ndarray, metric: str = "euclidean") -> np.ndarray:
+    """
+    scipy.spatial.distance.cdist, imported on the first call. importing scipy takes longer than most
+    predict calls, so a process that never needs it (e.g. a worker that only predicts) never pays for it.
+    """
+    from scipy.spatial.distance import cdist as scipy_cdist
+    return scipy_cdist(XA, XB, metric)
+
+
+def row_norms(mat: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    returns the squared euclidean norm of every row of `mat`
+
+    inputs:
+        mat: np.ndarray
+            a 2D matrix
+        out: np.ndarray
+            optional 1D array to write the result into
+    """
+    return np.einsum("ij,ij->i", mat, mat, out=out)
+
+
+def squared_distances(
+        X: np.ndarray,
+        Y: np.ndarray,
+        X_norms: np.ndarray = None,
+        Y_norms: np.ndarray = None,
+        out: np.ndarray = None) -> np.ndarray:
+    """
+    returns the squared euclidean distance between every row of `X` and every row of `Y`,
+    computed in place in `out` (allocated if not given) in the dtype of `X`.
+
+    inputs:
+        X: np.ndarray
+            a `n x m` 2D matrix
+        Y: np.ndarray
+            a `k x m` 2D matrix
+        X_norms: np.ndarray
+            cached row_norms(X), computed if not given
+        Y_norms: np.ndarray
+            cached row_norms(Y), computed if not given
+        out: np.ndarray
+            optional `n x k` array to write the result into
+
+    outputs:
+        np.ndarray
+            the `n x k` matrix of squared distances
+    """
+    if X_norms is None:
+        X_norms = row_norms(X)
+    if Y_norms is None:
+        Y_norms = row_norms(Y)
+
+    #the factor -2 goes on the smaller of the two matrices instead of an extra pass over the result
+    #(multiplying by a power of two is exact, so this does not change the rounding)
+    if X.shape[0] <= Y.shape[0]:
+        out = np.matmul(X * -2, Y.T, out=out)
+    else:
+        out = np.matmul(X, Y.T * -2, out=out)
+    out += X_norms[:, None]
+    out += Y_norms[None, :]
+    #rounding can push distances of (nearly) identical points slightly below 0
+    np.maximum(out, 0, out=out)
+    return out
+
+
+def euclidean_distances(
+        X: np.ndarray,
+        Y: np.ndarray,
+        X_norms: np.ndarray = None,
+        Y_norms: np.ndarray = None,
+        out: np.ndarray = None) -> np.ndarray:
+    """
+    same as squared_distances() but returns the euclidean distances
+    """
+    out = squared_distances(X, Y, X_norms, Y_norms, out=out)
+    return np.sqrt(out, out=out)
+
+
+def error_bound(X_norms: np.ndarray, Y_norms: np.ndarray, n_features: int, dtype) -> np.ndarray:
+    """
+    returns for every row of `X` the largest possible error of its squared distances to any row of `Y`
+    """
+    eps = np.finfo(dtype).eps
+    return (2 * n_features + 6) * eps * (X_norms + Y_norms.max())
+
+
+def _two_smallest(distances: np.ndarray, labels: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    returns the smallest and second smallest value of every row, `labels` holds the column of the smallest
+    """
+    n_rows, n_cols = distances.shape
+    if n_cols > 32:
+        #hide the smallest value for a moment instead of copying the matrix
+        rows = np.arange(n_rows)
+        smallest = distances[rows, labels]
+        distances[rows, labels] = np.inf
+        second = distances.min(axis=1)
+        distances[rows, labels] = smallest
+        return smallest, second
+
+    #numpy reduces short rows slowly, for few columns a pass per column over all rows is faster
+    smallest = distances[:, 0].copy()
+    second = np.full(n_rows, np.inf, dtype=distances.dtype)
+    larger = np.empty(n_rows, dtype=distances.dtype)
+    for col in range(1, n_cols):
+        np.maximum(smallest, distances[:, col], out=larger)
+        np.minimum(second, larger, out=second)
+        np.minimum(smallest, distances[:, col], out=smallest)
+    return smallest, second
+
+
+def assign_labels(
+        X: np.ndarray,
+        C: np.ndarray,
+        X_norms: np.ndarray = None,
+        C_norms: np.ndarray = None,
+        out: np.ndarray = None,
+        labels: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    finds the closest row of `C` for every row of `X`
+
+    inputs:
+        X: np.ndarray
+            a `n x m` 2D matrix of observations
+        C: np.ndarray
+            a `k x m` 2D matrix of centroids
+        X_norms: np.ndarray
+            cached row_norms(X), computed if not given
+        C_norms: np.ndarray
+            cached row_norms(C), computed if not given
+        out: np.ndarray
+            optional `n x k` array for the squared distances
+        labels: np.ndarray
+            optional integer array of length `n` for the labels
+
+    outputs:
+        (np.ndarray, np.ndarray)
+            the index of the closest centroid for every observation and the `n x k` squared distances.
+            rows that were close to a tie hold exact distances.
+    """
+    if X_norms is None:
+        X_norms = row_norms(X)
+    if C_norms is None:
+        C_norms = row_norms(C)
+
+    distances = squared_distances(X, C, X_norms, C_norms, out=out)
+    labels = np.argmin(distances, axis=1, out=labels)
+    if C.shape[0] < 2:
+        return labels, distances
+
+    closest, second = _two_smallest(distances, labels)
+
+    #both values can be off by the bound, so a smaller gap could be the other way around
+    near_tie = np.flatnonzero(second - closest <= 2 * error_bound(X_norms, C_norms, X.shape[1], distances.dtype))
+    if len(near_tie) > 0:
+        exact = cdist(
+            X[near_tie].astype(np.float64), C.astype(np.float64), "sqeuclidean")
+        distances[near_tie] = exact
+        labels[near_tie] = np.argmin(exact, axis=1)
+    return labels, distances
@@ -0,0 +1,152 @@
+import os
+import json
+import queue
+import threading
+import numpy as np
+
+'''
+a fitted model is saved as a directory of plain .npy files (one per array) next to a params.json with
+everything else. .npy files can be memory mapped: loading only maps the file, so a model loads in
+milliseconds no matter its size, and several worker processes that map the same file share one copy
+in the page cache instead of each reading it into its own memory.
+
+datasets are plain .npy files as well (np.save), every fit/predict/score accepts the path of one and
+maps it read-only instead of loading it.
+'''
+
+#bumped whenever the layout of a saved model changes, so old files fail loudly instead of loading wrong
+FORMAT_VERSION = 1
+
+
+def load_matrix(mat, mmap_mode: str = "r"):
+    """
+    returns `mat` as an array without copying it: a path to a .npy file is memory mapped,
+    arrays (including np.memmap) are returned as they are and anything else is returned unchanged
+    so the caller's own input checks still report it
+
+    inputs:
+        mat: np.ndarray, str or os.PathLike
+            the data or the path of a .npy file holding it
+        mmap_mode: str
+            the np.load mmap_mode for paths, "r" maps the file read-only
+    """
+    if isinstance(mat, (str, os.PathLike)):
+        if not str(mat).endswith(".npy"):
+            raise ValueError(f"only .npy files can be loaded as data, got '{mat}'.")
+        return np.load(mat, mmap_mode=mmap_mode)
+    return mat
+
+
+def _json_value(value):
+    """
+    json.dump hook for the values json does not know: numpy scalars (e.g. a np.int64 seed) become the
+    python number they hold, anything else can not be saved
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise ValueError(f"{type(value).__name__} values can not be saved in params.json.")
+
+
+def save_arrays(path, arrays: dict, params: dict):
+    """
+    writes every array of `arrays` to `<path>/<name>.npy` (None values are skipped) and `params` to
+    `<path>/params.json`. the directory is created if needed.
+    """
+    #params are converted before anything is written, so a value json can not hold does not leave a half saved model
+    text = json.dumps(dict(params, format_version=FORMAT_VERSION, arrays=sorted(
+        name for name, array in arrays.items() if array is not None)), indent=2, default=_json_value)
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        if array is not None:
+            #contiguous arrays can be mapped straight from the file
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+    #params.json is written last, a directory without it is an incomplete save
+    with open(os.path.join(path, "params.json"), "w") as handle:
+        handle.write(text)
+
+
+def load_arrays(path, mmap_mode: str = "r") -> (dict, dict):
+    """
+    reads a directory written by save_arrays and returns its (arrays, params). the arrays are memory
+    mapped with `mmap_mode` (None loads them into memory).
+    """
+    params_file = os.path.join(path, "params.json")
+    if not os.path.isfile(params_file):
+        raise ValueError(f"'{path}' is not a saved model (params.json is missing).")
+    with open(params_file) as handle:
+        params = json.load(handle)
+    if params.pop("format_version", None) != FORMAT_VERSION:
+        raise ValueError(f"'{path}' was saved in an unsupported format.")
+
+    arrays = {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in params.pop("arrays")}
+    return arrays, params
+
+
+def prefetch(chunks, depth: int = 1):
+    """
+    iterates over `chunks` like a for loop, but reads the next `depth` chunks on a background thread
+    while the caller works on the current one. reading a file (np.load, or the pages behind a memmap)
+    mostly waits on the disk and numpy releases the GIL in its kernels, so reading and computing overlap.
+    at most `depth` + 2 chunks are in memory at once: the one being used, the ones waiting and the one
+    being read.
+
+    inputs:
+        chunks: iterable
+            2D arrays, np.memmap slices (read into memory on the thread) or paths of .npy files
+        depth: int
+            how many chunks may be read ahead
+
+    outputs:
+        generator
+            the chunks as in-memory arrays, in order
+    """
+    if not isinstance(depth, int) or depth <= 0:
+        raise ValueError("depth must be a positive integer.")
+
+    def read(chunk):
+        if isinstance(chunk, (str, os.PathLike)):
+            return load_matrix(chunk, mmap_mode=None)
+        #np.array copies a memmap into memory, i.e. does the disk read here and not in the caller's thread
+        return np.array(chunk) if isinstance(chunk, np.memmap) else chunk
+
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object() #marks the end of the chunks
+
+    def put(item):
+        #wait for space, but give up if the consumer went away
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for chunk in chunks:
+                if not put((read(chunk), None)):
+                    return
+            put((done, None))
+        except BaseException as error:
+            #errors are raised again in the caller's thread
+            put((done, error))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = ready.get()
+            if error is not None:
+                raise error
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        #also runs when the caller stops early, the reader then quits at its next chunk
+        stop.set()
+        thread.join()
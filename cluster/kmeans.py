@@ -1,5 +1,10 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.spatial.distance import cdist
+from .distance import row_norms, assign_labels, cdist, _two_smallest
+from .predictor import KMeansPredictor
+from .io import load_matrix, save_arrays, load_arrays
 '''
 as always, I am using ChatGPT to help me understand the code and complete it. 
 
@@ -11,8 +16,277 @@ until reaching max_iter, even if centroids are already stable.
 due to float point precision errors direct comparisons between floats can be unreliable
 '''
 
+#rows per shard of the parallel assignment/update. the shards do not depend on n_jobs, so the partial
+#sums are always added up in the same order and the result is the same for any number of workers
+_SHARD_SIZE = 16384
+
+#the centroid update only moves the points that changed label between their clusters' sums while
+#fewer than this fraction of the points changed, otherwise all sums are recomputed from scratch
+#(moving a point costs about twice as much as adding it up once)
+_INCREMENTAL_MAX_FRACTION = 0.25
+
+#point to candidate distances computed at once by the k-means|| seeding (32MB in float64)
+_SEEDING_BLOCK_ELEMENTS = 2**22
+
+#relative slack on the bound checks of elkan/hamerly, so that rounding in the bounds can never
+#skip a point that lloyd would have moved to another cluster
+_BOUND_RTOL = 1e-10
+
+
+def _map_shards(pool: ThreadPoolExecutor, func, n_samples: int) -> list:
+    """
+    calls `func` on consecutive row slices of `_SHARD_SIZE` rows, in a thread pool if one is given
+    (numpy and scipy release the GIL in their kernels), and returns the results in shard order
+    """
+    shards = [slice(start, min(start + _SHARD_SIZE, n_samples)) for start in range(0, n_samples, _SHARD_SIZE)]
+    if pool is None:
+        return [func(shard) for shard in shards]
+    return list(pool.map(func, shards))
+
+
+def _cluster_sums(
+        mat: np.ndarray,
+        labels: np.ndarray,
+        k: int,
+        sums: np.ndarray = None,
+        counts: np.ndarray = None) -> (np.ndarray, np.ndarray):
+    """
+    returns the per-cluster sums (k x m) and counts (k) of the rows of `mat` in a single pass over
+    the labels per feature, instead of selecting the rows of every cluster with a boolean mask.
+    if `sums` and `counts` are given the result is added onto them.
+    """
+    if sums is None:
+        sums, counts = np.zeros((k, mat.shape[1])), np.zeros(k)
+    for feature in range(mat.shape[1]):
+        sums[:, feature] += np.bincount(labels, weights=mat[:, feature], minlength=k)
+    counts += np.bincount(labels, minlength=k)
+    return sums, counts
+
+
+def _kmeans_plusplus(
+        mat: np.ndarray,
+        k: int,
+        rng: np.random.Generator,
+        weights: np.ndarray = None,
+        centroids: np.ndarray = None,
+        closest_sq: np.ndarray = None) -> np.ndarray:
+    """
+    k-means++ seeding: the first centroid is a random point, every next one is drawn with probability
+    proportional to (weight times) the squared distance to the closest centroid chosen so far.
+    if `centroids` are given they are kept and only the remaining k - len(centroids) are drawn.
+    `closest_sq` are the squared distances of the points to the closest of those `centroids` if they
+    are known already (e.g. from the fit that found them), otherwise they are computed in blocks.
+    """
+    weights = np.ones(mat.shape[0]) if weights is None else weights
+    if centroids is None:
+        first = mat[rng.choice(mat.shape[0], p=weights / weights.sum())][None]
+    else:
+        first = np.asarray(centroids, dtype=float)
+    n_given = len(first)
+    centroids = np.empty((k, mat.shape[1]))
+    centroids[:n_given] = first
+    if closest_sq is not None:
+        #copied, the draws below update it in place
+        closest_sq = np.array(closest_sq, dtype=float)
+    else:
+        #in blocks of rows, all rows at once would be a n x len(centroids) matrix
+        step = _seeding_rows(n_given)
+        closest_sq = np.concatenate([
+            cdist(mat[start:start + step], first, "sqeuclidean").min(axis=1)
+            for start in range(0, mat.shape[0], step)])
+
+    for i in range(n_given, k):
+        potential = weights * closest_sq
+        total = potential.sum()
+        #if every point already sits on a centroid there is nothing left to prefer
+        p = potential / total if total > 0 else weights / weights.sum()
+        centroids[i] = mat[rng.choice(mat.shape[0], p=p)]
+        np.minimum(closest_sq, cdist(mat, centroids[i:i + 1], "sqeuclidean")[:, 0], out=closest_sq)
+    return centroids
+
+
+def _seeding_rows(n_candidates: int) -> int:
+    """
+    returns the number of rows per block of the k-means|| distance passes, so that a block holds
+    at most _SEEDING_BLOCK_ELEMENTS distances no matter how many candidates there are
+    """
+    return max(1, min(_SHARD_SIZE, _SEEDING_BLOCK_ELEMENTS // n_candidates))
+
+
+def _kmeans_parallel(
+        mat: np.ndarray,
+        k: int,
+        rng: np.random.Generator,
+        n_rounds: int = 5,
+        oversampling: float = 2.0) -> np.ndarray:
+    """
+    k-means|| seeding (Bahmani et al. 2012): instead of k sequential passes over the data, every round
+    samples about `oversampling * k` points at once with probability proportional to their squared
+    distance to the candidates so far. the candidates are weighted by how many points are closest
+    to them and reduced to k centroids with a weighted k-means++.
+    """
+    n_samples = mat.shape[0]
+    candidates = [mat[rng.integers(n_samples)]]
+    closest_sq = cdist(mat, np.array(candidates), "sqeuclidean")[:, 0]
+
+    for _ in range(n_rounds):
+        total = closest_sq.sum()
+        if total == 0:
+            break
+        chosen = np.flatnonzero(rng.random(n_samples) < oversampling * k * closest_sq / total)
+        if len(chosen) == 0:
+            continue
+        candidates.extend(mat[chosen])
+        #in blocks of rows, all rows at once would be a n x (oversampling * k) matrix per round
+        new_candidates = mat[chosen]
+        step = _seeding_rows(len(chosen))
+        for start in range(0, n_samples, step):
+            shard = slice(start, start + step)
+            np.minimum(
+                closest_sq[shard], cdist(mat[shard], new_candidates, "sqeuclidean").min(axis=1), out=closest_sq[shard])
+
+    candidates = np.array(candidates)
+    if len(candidates) < k:
+        #too few candidates (e.g. many duplicate points), top up with random points
+        extra = rng.choice(n_samples, k - len(candidates), replace=False)
+        return np.vstack([candidates, mat[extra]])
+
+    #weight every candidate by the number of points closest to it, in blocks to bound memory
+    step = _seeding_rows(len(candidates))
+    nearest = np.concatenate([
+        np.argmin(cdist(mat[start:start + step], candidates, "sqeuclidean"), axis=1)
+        for start in range(0, n_samples, step)])
+    weights = np.bincount(nearest, minlength=len(candidates)).astype(float)
+    return _kmeans_plusplus(candidates, k, rng, weights)
+
+
+def _bound_violated(upper: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    """
+    returns True where an upper distance bound is not safely below a lower bound, i.e. where the
+    distances have to be computed. ties count as violated so they are resolved exactly like argmin.
+    """
+    return upper * (1 + _BOUND_RTOL) >= lower * (1 - _BOUND_RTOL)
+
+
+def _paired_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    euclidean distance between each row of `a` and the same row of `b`
+    """
+    diff = a - b
+    return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+
+def _closest_two(distances: np.ndarray, labels: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    returns the distance to the assigned centroid and to the second closest centroid for every row
+    """
+    rows = np.arange(len(labels))
+    closest = distances[rows, labels]
+    if distances.shape[1] < 2:
+        return closest, np.full(len(labels), np.inf)
+    others = distances.copy()
+    others[rows, labels] = np.inf
+    return closest, others.min(axis=1)
+
+
+def _closest_other_centroid(centroids: np.ndarray) -> np.ndarray:
+    """
+    returns the distance from every centroid to its closest other centroid
+    """
+    centroid_distances = cdist(centroids, centroids)
+    np.fill_diagonal(centroid_distances, np.inf)
+    return centroid_distances.min(axis=1)
+
+
+class KMeansWorkspace:
+    def __init__(self, n_samples: int, k: int, n_features: int, dtype=np.float64):
+        """
+        Buffers that KMeans.fit works in, so that no iteration has to allocate the n x k distance matrix,
+        the labels or the centroid arrays again. pass the same workspace to several fits (e.g. a sweep
+        over k) to also skip the allocation between fits. it fits any data with at most `n_samples` rows,
+        at most `k` clusters and exactly `n_features` columns.
+
+        inputs:
+            n_samples: int
+                the largest number of observations
+            k: int
+                the largest number of centroids
+            n_features: int
+                the number of features
+            dtype: np.float64 or np.float32
+                the dtype of the KMeans models that will use the workspace
+        """
+        self.n_samples = n_samples
+        self.k = k
+        self.n_features = n_features
+        self.dtype = np.dtype(dtype)
+
+        #flat buffers, so that every smaller (n, k) still gets a contiguous view
+        self._distances = np.empty(n_samples * k, dtype=self.dtype)
+        self._labels = np.empty(n_samples, dtype=np.intp)
+        self._previous_labels = np.empty(n_samples, dtype=np.intp)
+        self._mat_norms = np.empty(n_samples, dtype=self.dtype)
+        #two centroid buffers, the update writes the new centroids into the one not in use
+        self._centroids = np.empty((2, k * n_features), dtype=self.dtype)
+        self._sums = np.empty(k * n_features)
+        self._counts = np.empty(k)
+        #set by precompute_norms(), the row norms of the data are then filled in for all fits
+        self._norms_ready = False
+
+    def precompute_norms(self, mat: np.ndarray):
+        """
+        computes the squared row norms of `mat` once, so that the lloyd fits using this workspace skip
+        them (e.g. every fit of a sweep over k). afterwards only pass the workspace to fits of this `mat`.
+
+        inputs:
+            mat: np.ndarray
+                the `n x m` data all later fits in this workspace will run on
+        """
+        mat = np.asarray(mat, dtype=self.dtype)
+        self._check(mat.shape[0], 1, mat.shape[1], self.dtype)
+        row_norms(mat, out=self._mat_norms[:mat.shape[0]])
+        self._norms_ready = True
+
+    def _check(self, n_samples: int, k: int, n_features: int, dtype):
+        """
+        raises a ValueError if the workspace can not hold a fit of this size
+        """
+        if n_samples > self.n_samples or k > self.k or n_features != self.n_features or np.dtype(dtype) != self.dtype:
+            raise ValueError(
+                f"workspace for up to {self.n_samples} x {self.n_features} data and k <= {self.k} in {self.dtype} "
+                f"can not be used for {n_samples} x {n_features} data with k = {k} in {np.dtype(dtype)}.")
+
+    def _views(self, n_samples: int, k: int, n_features: int) -> dict:
+        """
+        returns views of the buffers with the exact shapes of one fit
+        """
+        return {
+            "distances": self._distances[:n_samples * k].reshape(n_samples, k),
+            "labels": self._labels[:n_samples],
+            "previous_labels": self._previous_labels[:n_samples],
+            "mat_norms": self._mat_norms[:n_samples],
+            "centroids": [buffer[:k * n_features].reshape(k, n_features) for buffer in self._centroids],
+            "sums": self._sums[:k * n_features].reshape(k, n_features),
+            "counts": self._counts[:k],
+        }
+
+
 class KMeans:
-    def __init__(self, k: int, tol: float = 1e-6, max_iter: int = 100):
+    def __init__(
+            self,
+            k: int,
+            tol: float = 1e-6,
+            max_iter: int = 100,
+            algorithm: str = "lloyd",
+            batch_size: int = None,
+            n_jobs: int = 1,
+            empty_cluster: str = "farthest",
+            init="k-means++",
+            n_init: int = 1,
+            random_state=42,
+            dtype=np.float64,
+            callback=None,
+            convergence: str = "shift"):
         """
         In this method you should initialize whatever attributes will be required for the class.
 
@@ -25,9 +299,61 @@ class KMeans:
             k: int
                 the number of centroids to use in cluster fitting
             tol: float
-                the minimum error tolerance from previous error during optimization to quit the model fit
+                the minimum error tolerance from previous error during optimization to quit the model fit,
+                what it is compared against depends on `convergence`
             max_iter: int
                 the maximum number of iterations before quitting model fit
+            algorithm: str
+                "lloyd" computes every point to centroid distance in every iteration.
+                "elkan" and "hamerly" keep upper and lower distance bounds per point and use the
+                triangle inequality to skip most distance computations, giving the same result as "lloyd".
+                elkan keeps k lower bounds per point (n x k memory), hamerly only one.
+            batch_size: int
+                if given, fit() runs mini-batch kmeans: every iteration updates the centroids from a random
+                batch of `batch_size` rows instead of the whole matrix. this is also the size of the pieces
+                that fit_batches() cuts its chunks into.
+            n_jobs: int
+                number of threads for the assignment and centroid update of fit, -1 uses all cores.
+                the result does not depend on the number of threads.
+            empty_cluster: str
+                what happens to a centroid that lost all of its points during fit.
+                "farthest" moves it onto the point that is farthest from its own centroid,
+                "keep" leaves it where it was.
+            init: str or np.ndarray
+                how the starting centroids are chosen. "random" picks k distinct points, "k-means++" picks
+                them one by one with probability proportional to the squared distance to the closest
+                centroid so far, "k-means||" oversamples candidates in a few passes over the data and
+                reduces them with a weighted k-means++ (cheap for large n). a `k x m` array is used as is.
+            n_init: int
+                number of restarts from different starting centroids, the run with the lowest inertia is kept.
+                with n_jobs > 1 the restarts run in parallel. mini-batch and streamed fits can not restart,
+                they seed their first batch n_init times instead and keep the seeding with the lowest
+                inertia on that batch.
+            random_state: int, np.random.Generator or None
+                seed for the local random generator used by the initialization (the global numpy
+                random state is never touched). None gives a different result on every fit.
+            dtype: np.float64 or np.float32
+                the precision the data, centroids and distances are kept in. float32 halves the memory
+                and roughly doubles the speed of the distance computations, the labels stay exact
+                (see cluster/distance.py for the accuracy of the distances).
+            callback: callable
+                called after every iteration of fit with a dict describing it: the `restart` and
+                `iteration` (both counted from 0), `assign_time` and `update_time` in seconds, the `inertia`
+                of the assignment, the largest and total centroid `max_shift` / `shift`, the number of
+                points that changed their label `n_changed` (all points in the first iteration) and
+                whether the fit `converged`. restarts running in parallel call it from their own thread.
+                mini-batch fits report the whole batch step as `update_time` and None for `assign_time`
+                and `n_changed`.
+            convergence: str
+                when fit stops before max_iter.
+                "shift": the norm of the centroid shift of an update is below `tol` (absolute, so it depends
+                on the scale of the data).
+                "scaled_shift": the squared norm of the shift is below `tol` times the mean variance of the
+                features, the same for any scale of the data.
+                "labels": no point changed its label in an assignment, the centroids can not move anymore.
+                "inertia": the inertia improved by less than `tol` (relative) from one assignment to the next.
+                "labels" and "inertia" stop right after the assignment and skip the then useless update.
+                mini-batch fits only support the two shift modes, labels of different batches can not be compared.
         """
         if not isinstance(k, int) or k <= 0:
             #checks if k is an instance of the int class
@@ -42,6 +368,38 @@ class KMeans:
         #max_iter should be an integer, as this is the number of iteration before the algorithm stops. 
         if not isinstance(max_iter, int) or max_iter <= 0:
             raise ValueError("max_iter must be a positive integer")
+
+        if algorithm not in ("lloyd", "elkan", "hamerly"):
+            raise ValueError("algorithm must be one of 'lloyd', 'elkan' or 'hamerly'.")
+
+        if batch_size is not None and (not isinstance(batch_size, int) or batch_size <= 0):
+            raise ValueError("batch_size must be a positive integer or None.")
+
+        if not isinstance(n_jobs, int) or (n_jobs <= 0 and n_jobs != -1):
+            raise ValueError("n_jobs must be a positive integer or -1.")
+
+        if empty_cluster not in ("farthest", "keep"):
+            raise ValueError("empty_cluster must be 'farthest' or 'keep'.")
+
+        if isinstance(init, np.ndarray):
+            if init.ndim != 2 or init.shape[0] != k:
+                raise ValueError("an init array must be a k x m matrix.")
+        elif init not in ("k-means++", "k-means||", "random"):
+            raise ValueError("init must be 'k-means++', 'k-means||', 'random' or a k x m array.")
+
+        if not isinstance(n_init, int) or n_init <= 0:
+            raise ValueError("n_init must be a positive integer.")
+
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("dtype must be np.float32 or np.float64.")
+
+        if callback is not None and not callable(callback):
+            raise ValueError("callback must be callable or None.")
+
+        if convergence not in ("shift", "scaled_shift", "labels", "inertia"):
+            raise ValueError("convergence must be 'shift', 'scaled_shift', 'labels' or 'inertia'.")
+        if batch_size is not None and convergence in ("labels", "inertia"):
+            raise ValueError("mini-batch fits only support convergence='shift' or 'scaled_shift'.")
         
         #here I initialize the instance attributes of the Kmeans class, making them available for later use
         #the methods like fit(), predict() etc. access these attributes without needing to pass them as arguments every time.  
@@ -50,13 +408,37 @@ class KMeans:
         self.k = k 
         self.tol = tol
         self.max_iter = max_iter
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.empty_cluster = empty_cluster
+        self.init = init
+        self.n_init = n_init
+        self.random_state = random_state
+        self.dtype = np.dtype(dtype)
+        self.callback = callback
+        self.convergence = convergence
         self.centroids = None
         self.labels = None
+        #distance of every point to its own and to the second closest centroid in the last assignment
+        #pass of fit (lloyd only, None if max_iter ran out), all the simplified silhouette needs
+        self._own_distances = None
+        self._other_distances = None
+        self.n_distance_evals_ = None #number of point to centroid distances computed during fit
+        self.inertia_ = None #sum of squared distances of every point to its centroid
+        self.cluster_inertia_ = None #the same sum per centroid
+        self.inertia_history_ = None #inertia of the assignment in every iteration of the (best) fit
+        self.n_iter_ = None #number of iterations of the kept fit
+        self.converged_ = None #False if the kept fit stopped at max_iter
+        self.timings_ = None #seconds the kept fit spent in its "init", "assign" and "update" phases
+        self._counts = None #number of points each centroid has absorbed so far (mini-batch / partial_fit)
+        self._batch_inertia = None #inertia of the last partial_fit batch against the centroids it was assigned to
+        self._predictor = None #index over the current centroids used by predict, dropped whenever they change
         
     
 
 
-    def fit(self, mat: np.ndarray):
+    def fit(self, mat: np.ndarray, workspace: KMeansWorkspace = None):
         """
         Fits the kmeans algorithm onto a provided 2D matrix.
         As a bit of background, this method should not return anything.
@@ -68,45 +450,653 @@ class KMeans:
         functions, but for now we will have you implement them both separately.
 
         inputs:
-            mat: np.ndarray
-                A 2D matrix where the rows are observations and columns are features
+            mat: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features, a np.memmap or the
+                path of a .npy file (memory mapped, not read into memory)
+            workspace: KMeansWorkspace
+                optional preallocated buffers to run the fit in, e.g. shared by the fits of a sweep over k.
+                the fitted labels are copied out of it, so it can be reused right away. mini-batch fits
+                (batch_size set) only hold one batch and do not use it
         """
+        mat = load_matrix(mat)
         #the input data set has to be 2D, because the rows are the samples and the columns are the features we are interested in. 
         #kmeans needs multiple features to measure distances between points and form clusters. 
         if not isinstance(mat, np.ndarray) or mat.ndim!= 2:
             raise ValueError("Input data must be a 2-D numpy array.")
         
         n_samples, n_features = mat.shape
-        
-        #randomly initialize centroids from the dataset
-        np.random.seed(42) #for reproducibility
-        #selects k unique random indices from the dataset, replace=False ensures we don't pick the same data point twice. 
-        random_indices = np.random.choice(n_samples, self.k, replace=False)
-        self.centroids = mat[random_indices]
-
-        for _ in range(self.max_iter): #just repeats for the amount of iterables. no need for index.
-            #compute distances and assign cluters
-            distances = cdist(mat, self.centroids) #takes euclidean distance between each data point and each centroid
-
-            #labels is a 1D array where each value is the cluster assignment for a sample, based on np.argim which finds
-            #the index of the closest centroid for each data point. 
-            labels = np.argmin(distances, axis=1)
-
-            #compute new centroids, as the mean of all assigned points in each cluster. 
-            #labels is a 1D array where each value represents the assigned cluster for each data point. 
-            #labels == i creates a boolean mask that selects only the points assigned to cluster i. 
-            new_centroids = np.array([mat[labels == i].mean(axis=0) for i in range(self.k)])
-
-            #check for convergece, how close new centroid assigned is to the previous one
-            if np.linalg.norm(new_centroids - self.centroids) < self.tol:
-                break #this immediately stops the loop and skips any remaining iterations. 
-            
-            #update self.centroid if needed
-            self.centroids = new_centroids
-        
-        self.labels = labels #store labels for error calculation, as labels link each data point to its assigned cluster
+        if n_samples < self.k:
+            raise ValueError("The number of observations must be at least k.")
+        if isinstance(self.init, np.ndarray) and self.init.shape[1] != n_features:
+            raise ValueError("Feature mismatch: init centroids must have the same number of features as the data.")
+
+        if self.batch_size is not None:
+            self._fit_minibatch(mat)
+            return
+
+        #no copy if the data already has the right dtype (a memmap stays a view of the file)
+        mat = np.asarray(mat, dtype=self.dtype)
+        if workspace is not None:
+            workspace._check(n_samples, self.k, n_features, self.dtype)
+
+        #every restart gets its own generator drawn from the local one, so runs are reproducible
+        #no matter if they run one after the other or in parallel
+        rng = np.random.default_rng(self.random_state)
+        n_init = 1 if isinstance(self.init, np.ndarray) else self.n_init
+        run_rngs = [np.random.default_rng(seed) for seed in rng.integers(2**63, size=n_init)]
+
+        def run(restart, pool, ws):
+            start = time.perf_counter()
+            centroids = self._init_centroids(mat, run_rngs[restart])
+            init_time = time.perf_counter() - start
+            result = self._fit_single(mat, centroids, pool, ws, restart)
+            result["timings"]["init"] = init_time
+            return result
+
+        def new_workspace():
+            return KMeansWorkspace(n_samples, self.k, n_features, self.dtype)
+
+        #one pool for the whole fit. with several restarts each restart is one task, otherwise the
+        #shards of the data are handed to the pool in every iteration
+        pool = ThreadPoolExecutor(self.n_jobs) if self.n_jobs > 1 else None
+        try:
+            if pool is not None and n_init > 1:
+                #restarts running at the same time need a workspace each
+                results = list(pool.map(lambda restart: run(restart, None, new_workspace()), range(n_init)))
+                #keep the restart with the lowest inertia, the first one wins a tie
+                best = min(results, key=lambda result: result["inertia"])
+                best_ws = None
+            else:
+                #one after the other two workspaces are enough: the best run so far and the current one
+                results, best, best_ws, spare = [], None, None, workspace
+                for restart in range(n_init):
+                    ws = spare if spare is not None else new_workspace()
+                    result = run(restart, pool, ws)
+                    results.append(result)
+                    if best is None or result["inertia"] < best["inertia"]:
+                        best, best_ws, spare = result, ws, best_ws
+                    else:
+                        spare = ws
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        #the results point into the workspace buffers. a workspace of the caller is reused later, so copy out of it
+        owned = best_ws is None or best_ws is not workspace
+        self.centroids = best["centroids"].copy()
+        self._predictor = None
+        self.labels = best["labels"] if owned else best["labels"].copy() #store labels for error calculation, as labels link each data point to its assigned cluster
+        #keep the distances to the closest two centroids of the final assignment so scoring does not have
+        #to recompute them. not the n x k matrix, that would hold O(n*k) memory for the lifetime of the model
+        self._own_distances, self._other_distances = None, None
+        if best["distances"] is not None:
+            #labels are the argmin of every row, so the smallest distance is the one to the own centroid
+            own, other = _two_smallest(best["distances"], best["labels"])
+            #lloyd works with squared distances
+            self._own_distances = np.sqrt(own)
+            self._other_distances = np.sqrt(other)
+        self.n_distance_evals_ = sum(result["n_evals"] for result in results)
+        self.cluster_inertia_ = best["cluster_inertia"]
+        self.inertia_ = float(self.cluster_inertia_.sum())
+        self.inertia_history_ = best["inertia_history"]
+        self.n_iter_ = len(self.inertia_history_)
+        self.converged_ = best["converged"]
+        self.timings_ = best["timings"]
+        #lets partial_fit keep updating the fitted model with new data
+        self._counts = np.bincount(self.labels, minlength=self.k).astype(float)
+
+    def _fit_single(
+            self,
+            mat: np.ndarray,
+            centroids: np.ndarray,
+            pool: ThreadPoolExecutor,
+            workspace: KMeansWorkspace,
+            restart: int = 0) -> dict:
+        """
+        runs kmeans from the given starting centroids until convergence or max_iter and returns a dict
+        with the final `centroids`, `labels`, squared `distances` (lloyd only, None if max_iter ran out), `n_evals`, `inertia`,
+        `cluster_inertia`, `inertia_history`, `converged` and phase `timings`.
+        the first three arrays are views into `workspace`. `restart` is only passed on to the callback.
+        """
+        ws = workspace._views(mat.shape[0], self.k, mat.shape[1])
+        if self.algorithm == "lloyd" and not workspace._norms_ready:
+            #the squared row norms of the data never change, lloyd computes them once for all iterations
+            row_norms(mat, out=ws["mat_norms"])
+        #the centroids are swapped between the two buffers of the workspace in every iteration
+        current = 0
+        ws["centroids"][current][:] = centroids
+        centroids = ws["centroids"][current]
+
+        #all algorithms share the same update and convergence check, they only differ in how the
+        #labels are found. the assigner keeps whatever it needs between iterations in `state`.
+        assign = {
+            "lloyd": self._assign_lloyd,
+            "elkan": self._assign_elkan,
+            "hamerly": self._assign_hamerly}[self.algorithm]
+        state = {"n_evals": 0, "pool": pool, "ws": ws}
+        shift = None #how far each centroid moved in the previous update
+        history = []
+        #perf_counter costs well below a microsecond, so the phase timings are always recorded
+        timings = {"assign": 0.0, "update": 0.0}
+        converged = False
+        callback = self.callback
+        previous_labels = ws["previous_labels"]
+        shift_limit = self._shift_limit(mat)
+
+        for iteration in range(self.max_iter):
+            start = time.perf_counter()
+            if iteration > 0:
+                #the assigners overwrite the labels in place, keep the old ones to see which points changed
+                np.copyto(previous_labels, labels)
+
+            #labels is a 1D array where each value is the cluster assignment for a sample,
+            #i.e. the index of the closest centroid for each data point.
+            labels = assign(mat, centroids, shift, state)
+            #the inertia comes with the distances of the assignment, no extra pass over the data
+            if self.algorithm == "lloyd":
+                cluster_inertia = state["cluster_inertia"]
+            else:
+                cluster_inertia = self._tighten_bounds(mat, centroids, labels, state)
+            history.append(float(cluster_inertia.sum()))
+            changed = None if iteration == 0 else np.flatnonzero(labels != previous_labels)
+            n_changed = len(labels) if changed is None else len(changed)
+            assigned = time.perf_counter()
+
+            if self.convergence == "labels":
+                converged = n_changed == 0
+            elif self.convergence == "inertia" and iteration > 0:
+                converged = history[-2] - history[-1] <= self.tol * history[-2]
+
+            if converged:
+                #the centroids stay as they are, they were not updated
+                shift = np.zeros(self.k)
+            else:
+                #compute new centroids, as the mean of all assigned points in each cluster.
+                #late iterations only move a few points, then only those are moved between the cluster sums
+                incremental = changed is not None and n_changed < _INCREMENTAL_MAX_FRACTION * len(labels)
+                new_centroids = self._update_centroids(
+                    mat, labels, centroids, pool, ws, ws["centroids"][1 - current],
+                    changed=changed if incremental else None)
+                shift = np.linalg.norm(new_centroids - centroids, axis=1)
+                #check for convergece, how close new centroid assigned is to the previous one
+                if self.convergence in ("shift", "scaled_shift"):
+                    converged = np.sum(shift ** 2) < shift_limit
+            updated = time.perf_counter()
+            timings["assign"] += assigned - start
+            timings["update"] += updated - assigned
+
+            if callback is not None:
+                callback({
+                    "restart": restart,
+                    "iteration": iteration,
+                    "assign_time": assigned - start,
+                    "update_time": updated - assigned,
+                    "inertia": history[-1],
+                    "max_shift": float(shift.max()),
+                    "shift": float(np.sqrt(np.sum(shift ** 2))),
+                    "n_changed": n_changed,
+                    "converged": bool(converged),
+                })
+
+            if converged:
+                break #this immediately stops the loop and skips any remaining iterations.
+
+            #update the centroids if needed
+            centroids, current = new_centroids, 1 - current
+        else:
+            """
+            max_iter ran out, so the centroids moved after the last assignment. every centroid moved
+            onto the mean of its points, and for the mean
+                sum ||x - old||^2 = sum ||x - mean||^2 + count * ||mean - old||^2
+            so the inertia with the new centroids is the old one minus count * shift^2.
+            (empty clusters have no inertia, the clamp at 0 takes care of them)
+            """
+            counts = np.bincount(labels, minlength=self.k)
+            cluster_inertia = np.maximum(cluster_inertia - counts * shift ** 2, 0)
+            #the distances belong to the centroids before that update, no shortcut makes them fit the new ones
+            state["distances"] = None
+
+        return {
+            "centroids": centroids,
+            "labels": labels,
+            "distances": state.get("distances"),
+            "n_evals": state["n_evals"],
+            #sum of squared distances of every point to its centroid, used to pick the best restart
+            "inertia": float(cluster_inertia.sum()),
+            "cluster_inertia": cluster_inertia,
+            "inertia_history": history,
+            "converged": bool(converged),
+            "timings": timings,
+        }
+
+    def _shift_limit(self, mat: np.ndarray) -> float:
+        """
+        returns the value the squared norm of the centroid shift has to stay below for the shift convergence modes
+        """
+        if self.convergence != "scaled_shift":
+            return self.tol ** 2
+        #mean variance of the features = (mean squared norm of the rows - squared norm of the mean row) / m,
+        #without the n x m temporary of np.var
+        mean = mat.mean(axis=0)
+        total_variance = np.einsum("ij,ij->", mat, mat) / mat.shape[0] - mean @ mean
+        return self.tol * max(total_variance, 0) / mat.shape[1]
+
+    def _init_centroids(self, mat: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        returns the k starting centroids according to `init`
+        """
+        if isinstance(self.init, np.ndarray):
+            return np.array(self.init, dtype=self.dtype)
+        if self.init == "random":
+            #selects k unique random indices from the dataset, replace=False ensures we don't pick the same data point twice.
+            return np.array(mat[np.sort(rng.choice(mat.shape[0], self.k, replace=False))], dtype=self.dtype)
+        if self.init == "k-means++":
+            return _kmeans_plusplus(mat, self.k, rng).astype(self.dtype)
+        return _kmeans_parallel(mat, self.k, rng).astype(self.dtype)
+
+    def partial_fit(self, batch: np.ndarray):
+        """
+        Updates the centroids with one batch of observations, without looking at any earlier data again.
+        every centroid moves to the running mean of all points that were ever assigned to it, using
+        per-centroid counts. the first batch initializes the centroids and needs at least k rows.
+
+        inputs:
+            batch: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features, a np.memmap or the
+                path of a .npy file
+        """
+        batch = load_matrix(batch)
+        if not isinstance(batch, np.ndarray) or batch.ndim != 2:
+            raise ValueError("Input data must be a 2-D numpy array.")
+        batch = np.asarray(batch, dtype=self.dtype)
+
+        if self.centroids is None or self._counts is None:
+            if batch.shape[0] < self.k:
+                raise ValueError("The first batch needs at least k observations to initialize the centroids.")
+            self._start_partial(batch, np.random.default_rng(self.random_state))
+        elif batch.shape[1] != self.centroids.shape[1]:
+            raise ValueError("Feature mismatch: batch must have the same number of features as the centroids.")
+
+        labels, distances = assign_labels(batch, self.centroids)
+        self.n_distance_evals_ += distances.size
+        #inertia of the batch before the update, mini-batch fit records it as its history
+        self._batch_inertia = float(np.sum(distances[np.arange(len(labels)), labels]))
+
+        batch_sums, batch_counts = _cluster_sums(batch, labels, self.k)
+
+        """
+        running mean: with c points already absorbed and b new ones, the centroid becomes
+        (c * old + sum_new) / (c + b) = old + (sum_new - b * old) / (c + b).
+        centroids that got no point in this batch stay where they are.
+        """
+        self._counts += batch_counts
+        moved = batch_counts > 0
+        self.centroids[moved] += (
+            (batch_sums[moved] - batch_counts[moved, None] * self.centroids[moved]) / self._counts[moved, None])
+        #the distances and inertia of the last fit and the index of predict belong to the old centroids
+        self._own_distances = None
+        self._other_distances = None
+        self.inertia_ = None
+        self.cluster_inertia_ = None
+        self._predictor = None
+
+    def _start_partial(self, batch: np.ndarray, rng: np.random.Generator):
+        """
+        initializes the centroids from the first batch of a streamed / mini-batch fit. with n_init > 1
+        the batch is seeded n_init times and the seeding with the lowest inertia on the batch is kept
+        (a streamed fit can not restart, a seeding that put two centroids into one cluster stays that way)
+        """
+        if isinstance(self.init, np.ndarray) and self.init.shape[1] != batch.shape[1]:
+            raise ValueError("Feature mismatch: init centroids must have the same number of features as the data.")
+        n_init = 1 if isinstance(self.init, np.ndarray) else self.n_init
+        best, best_inertia, n_evals = None, np.inf, 0
+        for _ in range(n_init):
+            centroids = self._init_centroids(batch, rng)
+            if n_init > 1:
+                labels, distances = assign_labels(batch, centroids)
+                n_evals += distances.size
+                inertia = np.sum(distances[np.arange(len(labels)), labels])
+                #the first seeding wins a tie
+                if inertia >= best_inertia:
+                    continue
+                best_inertia = inertia
+            best = centroids
+        self.centroids = best
+        self._predictor = None
+        self._counts = np.zeros(self.k)
+        self.labels = None
+        self._own_distances = None
+        self._other_distances = None
+        self.n_distance_evals_ = n_evals
+        self.inertia_ = None
+        self.cluster_inertia_ = None
+        self.inertia_history_ = None
+        self.n_iter_ = None
+        self.converged_ = None
+        self.timings_ = None
+
+    def fit_batches(self, chunks):
+        """
+        Fits the model on data that arrives in chunks, e.g. a generator reading a np.memmap or files
+        from disk. only one chunk is held in memory at a time. chunks are cut into pieces of
+        `batch_size` rows (if set) and passed to partial_fit. the model starts from scratch,
+        call partial_fit afterwards to keep updating it.
+
+        inputs:
+            chunks: iterable
+                an iterable of 2D matrices with the same number of columns
+        """
+        self.centroids = None
+        self._counts = None
+        self._predictor = None
+        for chunk in chunks:
+            step = self.batch_size or len(chunk)
+            for start in range(0, len(chunk), step):
+                self.partial_fit(chunk[start:start + step])
+
+        if self.centroids is None:
+            raise ValueError("No data was provided to fit_batches.")
+
+    def _fit_minibatch(self, mat: np.ndarray):
+        """
+        mini-batch kmeans on a matrix that can be a np.memmap: every iteration draws a random batch of
+        rows, so only `batch_size` rows are read into memory at once. the labels are computed at the end
+        in batches as well.
+        """
+        n_samples = mat.shape[0]
+        batch_size = min(self.batch_size, n_samples)
+        rng = np.random.default_rng(self.random_state)
+
+        self.centroids = None
+        self._counts = None
+        history = []
+        #a batch step assigns and updates at once, it counts as "update", "assign" is the final labelling
+        timings = {"init": 0.0, "assign": 0.0, "update": 0.0}
+        converged = False
+        for iteration in range(self.max_iter):
+            start = time.perf_counter()
+            #sorted indices read a memmap front to back
+            batch = np.asarray(mat[np.sort(rng.choice(n_samples, batch_size, replace=False))], dtype=self.dtype)
+            if self.centroids is None:
+                self._start_partial(batch, rng)
+                #the scale of the data for "scaled_shift" comes from the first batch, not a pass over all rows
+                shift_limit = self._shift_limit(batch)
+                timings["init"] = time.perf_counter() - start
+                start = time.perf_counter()
+            previous = self.centroids.copy()
+            self.partial_fit(batch)
+            #only the batch is seen, its inertia scaled up to all rows estimates the inertia of the iteration
+            history.append(self._batch_inertia * n_samples / batch_size)
+
+            shift = np.linalg.norm(self.centroids - previous, axis=1)
+            converged = np.sum(shift ** 2) < shift_limit
+            elapsed = time.perf_counter() - start
+            timings["update"] += elapsed
+            if self.callback is not None:
+                self.callback({
+                    "restart": 0,
+                    "iteration": iteration,
+                    "assign_time": None,
+                    "update_time": elapsed,
+                    "inertia": history[-1],
+                    "max_shift": float(shift.max()),
+                    "shift": float(np.sqrt(np.sum(shift ** 2))),
+                    "n_changed": None, #every batch has different points
+                    "converged": bool(converged),
+                })
+            if converged:
+                break
+        self.inertia_history_ = history
+        self.n_iter_ = len(history)
+        self.converged_ = bool(converged)
+
+        #the final assignment also gives the inertia of every cluster
+        assign_start = time.perf_counter()
+        self.labels = np.empty(n_samples, dtype=np.intp)
+        self.cluster_inertia_ = np.zeros(self.k)
+        for row in range(0, n_samples, batch_size):
+            labels, distances = assign_labels(
+                np.asarray(mat[row:row + batch_size], dtype=self.dtype), self.centroids,
+                labels=self.labels[row:row + batch_size])
+            own = distances[np.arange(len(labels)), labels]
+            self.cluster_inertia_ += np.bincount(labels, weights=own, minlength=self.k)
+        self.inertia_ = float(self.cluster_inertia_.sum())
+        timings["assign"] = time.perf_counter() - assign_start
+        self.timings_ = timings
+
+    def _update_centroids(
+            self,
+            mat: np.ndarray,
+            labels: np.ndarray,
+            centroids: np.ndarray,
+            pool: ThreadPoolExecutor,
+            ws: dict = None,
+            out: np.ndarray = None,
+            changed: np.ndarray = None) -> np.ndarray:
+        """
+        returns the mean of the points assigned to each centroid. every shard of rows returns its
+        per-cluster sums and counts, which are then added up in shard order.
+        centroids without any point are handled according to `empty_cluster`.
+        `ws` are the workspace views for the sums and counts and `out` receives the new centroids.
+
+        `changed` (only with `ws`) are the rows whose label differs from `ws["previous_labels"]`. the
+        sums and counts in `ws` are then still the ones of the previous labels and only those rows
+        are moved from their old to their new cluster. only the clusters they left or joined get a
+        new centroid, the others keep theirs.
+        """
+        if ws is None:
+            sums, counts = np.zeros((self.k, mat.shape[1])), np.zeros(self.k)
+        else:
+            sums, counts = ws["sums"], ws["counts"]
+
+        if changed is not None:
+            old_labels = ws["previous_labels"][changed]
+            new_labels = labels[changed]
+            moved = mat[changed]
+            #take the moved points out of their old cluster and add them to the new one
+            old_sums, old_counts = _cluster_sums(moved, old_labels, self.k)
+            sums -= old_sums
+            counts -= old_counts
+            _cluster_sums(moved, new_labels, self.k, sums, counts)
+
+            touched = np.zeros(self.k, dtype=bool)
+            touched[old_labels] = True
+            touched[new_labels] = True
+            if out is None:
+                out = np.empty_like(centroids)
+            out[:] = centroids
+            out[touched] = sums[touched] / np.maximum(counts[touched], 1)[:, None]
+            return self._fill_empty(mat, labels, centroids, out, touched & (counts == 0))
+
+        sums[:], counts[:] = 0, 0
+        if pool is None:
+            #one after the other every shard adds onto the same buffers
+            for start in range(0, mat.shape[0], _SHARD_SIZE):
+                shard = slice(start, start + _SHARD_SIZE)
+                _cluster_sums(mat[shard], labels[shard], self.k, sums, counts)
+        else:
+            #in parallel every shard gets its own partial sums, added up in the same order
+            for partial_sums, partial_counts in _map_shards(
+                    pool, lambda shard: _cluster_sums(mat[shard], labels[shard], self.k), mat.shape[0]):
+                sums += partial_sums
+                counts += partial_counts
+
+        empty = counts == 0
+        #the sums are accumulated in float64, the centroids are kept in the dtype of the model.
+        #sums and counts stay as they are, the next incremental update starts from them
+        if out is None:
+            out = np.empty((self.k, mat.shape[1]), dtype=self.dtype)
+        np.divide(sums, np.maximum(counts, 1)[:, None], out=out, casting="same_kind")
+        return self._fill_empty(mat, labels, centroids, out, empty)
+
+    def _fill_empty(
+            self,
+            mat: np.ndarray,
+            labels: np.ndarray,
+            centroids: np.ndarray,
+            new_centroids: np.ndarray,
+            empty: np.ndarray) -> np.ndarray:
+        """
+        places the centroids of the `empty` clusters according to `empty_cluster` and returns `new_centroids`
+        """
+        if not empty.any():
+            return new_centroids
+
+        if self.empty_cluster == "keep":
+            new_centroids[empty] = centroids[empty]
+        else:
+            #the points that are worst represented by their centroid become the new centroids
+            own_distances = _paired_distances(mat, centroids[labels])
+            farthest = np.argsort(-own_distances, kind="stable")[:np.sum(empty)]
+            new_centroids[empty] = mat[farthest]
+        return new_centroids
+
+    def _assign_lloyd(self, mat: np.ndarray, centroids: np.ndarray, shift: np.ndarray, state: dict) -> np.ndarray:
+        """
+        assigns every point to its closest centroid by computing all n x k (squared) distances
+        """
+        ws = state["ws"]
+        distances, labels, mat_norms = ws["distances"], ws["labels"], ws["mat_norms"]
+        centroid_norms = row_norms(centroids)
+
+        def assign_shard(shard):
+            #compute the squared euclidean distance between each data point and each centroid with one matrix
+            #product and find the index of the closest centroid for each data point (exact, near ties are recomputed)
+            assign_labels(
+                mat[shard], centroids, mat_norms[shard], centroid_norms, out=distances[shard], labels=labels[shard])
+            #the per-cluster inertia of this shard, from the distances that were just computed
+            own = distances[shard][np.arange(len(labels[shard])), labels[shard]]
+            return np.bincount(labels[shard], weights=own, minlength=self.k)
+
+        #shard sums added up in shard order, the same for any number of threads
+        state["cluster_inertia"] = np.sum(_map_shards(state.get("pool"), assign_shard, mat.shape[0]), axis=0)
+        state["distances"] = distances
+        state["n_evals"] += distances.size
+        return labels
+
+    def _tighten_bounds(
+            self,
+            mat: np.ndarray,
+            centroids: np.ndarray,
+            labels: np.ndarray,
+            state: dict) -> np.ndarray:
+        """
+        elkan/hamerly only know an upper bound on the distance of most points to their centroid. this computes
+        the exact one for every point (n distances, the same work as the centroid update), which resets the
+        upper bounds so the next iteration can skip more points, and returns the per-cluster inertia.
+        """
+        upper = state["upper"]
+
+        def shard_inertia(shard):
+            upper[shard] = _paired_distances(mat[shard], centroids[labels[shard]])
+            return np.bincount(labels[shard], weights=upper[shard] ** 2, minlength=self.k)
+
+        cluster_inertia = np.sum(_map_shards(state.get("pool"), shard_inertia, mat.shape[0]), axis=0)
+        if self.algorithm == "elkan":
+            #the distance to the own centroid is also its tightest lower bound
+            state["lower"][np.arange(len(labels)), labels] = upper
+        state["n_evals"] += len(labels)
+        return cluster_inertia
+
+    def _assign_hamerly(self, mat: np.ndarray, centroids: np.ndarray, shift: np.ndarray, state: dict) -> np.ndarray:
+        """
+        Hamerly's algorithm: every point keeps an upper bound on the distance to its own centroid and
+        a single lower bound on the distance to every other centroid. if the upper bound is below
+        the lower bound the label can not have changed and no distance has to be computed.
+        distances come from cdist here, as the bounds must never be tighter than the exact values.
+        """
+        if shift is None:
+            #first iteration, compute everything once to set up the bounds
+            distances = cdist(mat, centroids)
+            state["n_evals"] += distances.size
+            labels = np.argmin(distances, axis=1, out=state["ws"]["labels"])
+            state["labels"] = labels
+            state["upper"], state["lower"] = _closest_two(distances, labels)
+            return labels
+
+        labels, upper, lower = state["labels"], state["upper"], state["lower"]
+
+        #a centroid moving by `shift` changes the distance to it by at most `shift` (triangle inequality)
+        upper += shift[labels]
+        largest = np.argmax(shift)
+        other_shift = np.max(np.delete(shift, largest)) if len(shift) > 1 else 0
+        lower -= np.where(labels == largest, other_shift, shift[largest])
+
+        #no point can be closer to another centroid than half the distance between the two centroids
+        half_gap = 0.5 * _closest_other_centroid(centroids)
+        bound = np.maximum(half_gap[labels], lower)
+
+        #tighten the upper bound of the points that might have changed cluster
+        check = np.flatnonzero(_bound_violated(upper, bound))
+        upper[check] = _paired_distances(mat[check], centroids[labels[check]])
+        state["n_evals"] += len(check)
+
+        #the remaining candidates get a full distance row
+        check = check[_bound_violated(upper[check], bound[check])]
+        if len(check) > 0:
+            distances = cdist(mat[check], centroids)
+            state["n_evals"] += distances.size
+            labels[check] = np.argmin(distances, axis=1)
+            upper[check], lower[check] = _closest_two(distances, labels[check])
+
+        return labels
+
+    def _assign_elkan(self, mat: np.ndarray, centroids: np.ndarray, shift: np.ndarray, state: dict) -> np.ndarray:
+        """
+        Elkan's algorithm: like Hamerly but with one lower bound per point and centroid (n x k),
+        so only the distances to the centroids that could actually be closer are computed.
+        """
+        if shift is None:
+            distances = cdist(mat, centroids)
+            state["n_evals"] += distances.size
+            labels = np.argmin(distances, axis=1, out=state["ws"]["labels"])
+            state["labels"] = labels
+            state["upper"] = distances[np.arange(len(labels)), labels]
+            state["lower"] = distances #the exact distances are the tightest lower bounds
+            return labels
+
+        labels, upper, lower = state["labels"], state["upper"], state["lower"]
+        upper += shift[labels]
+        lower -= shift
+        np.maximum(lower, 0, out=lower)
+
+        centroid_distances = cdist(centroids, centroids)
+        np.fill_diagonal(centroid_distances, np.inf)
+        half_gap = 0.5 * centroid_distances.min(axis=1)
+
+        #points whose upper bound is below half the gap to the closest other centroid keep their label
+        rows = np.flatnonzero(_bound_violated(upper, half_gap[labels]))
+        if len(rows) == 0:
+            return labels
+
+        #centroid j can only be closer if the upper bound exceeds both the lower bound for j and half
+        #the distance between the own centroid and j
+        def candidates(rows):
+            limit = np.maximum(lower[rows], 0.5 * centroid_distances[labels[rows]])
+            return _bound_violated(upper[rows, None], limit)
+
+        #tighten the upper bound of the rows that have any candidate
+        rows = rows[candidates(rows).any(axis=1)]
+        upper[rows] = _paired_distances(mat[rows], centroids[labels[rows]])
+        lower[rows, labels[rows]] = upper[rows]
+        state["n_evals"] += len(rows)
 
-       
+        #compute the distances to the remaining candidate centroids and refresh their lower bounds
+        mask = candidates(rows)
+        pair_rows, pair_cols = np.nonzero(mask)
+        pair_rows = rows[pair_rows]
+        pair_distances = _paired_distances(mat[pair_rows], centroids[pair_cols])
+        lower[pair_rows, pair_cols] = pair_distances
+        state["n_evals"] += len(pair_rows)
+
+        #pick the closest of the own centroid and the candidates, ties go to the lower index like argmin
+        best = np.full((len(rows), self.k), np.inf)
+        best[np.arange(len(rows)), labels[rows]] = upper[rows]
+        best[mask] = pair_distances
+        labels[rows] = np.argmin(best, axis=1)
+        upper[rows] = best[np.arange(len(rows)), labels[rows]]
+
+        return labels
 
     #this method does not modify centroids, only classifies new points. 
     #this method classifies new data based on the trained centroids without modifying them. 
@@ -120,23 +1110,157 @@ class KMeans:
             the data that the clusters were fit on?
 
         inputs:
-            mat: np.ndarray
-                A 2D matrix where the rows are observations and columns are features
+            mat: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features, a np.memmap or the
+                path of a .npy file
 
         outputs:
             np.ndarray
                 a 1D array with the cluster label for each of the observations in `mat`
         """
-        if not isinstance(mat, np.ndarray) or mat.ncim != 2:
+        mat = load_matrix(mat)
+        if not isinstance(mat, np.ndarray) or mat.ndim != 2:
             raise ValueError("Input data must be a 2D Numpy array.")
         if self.centroids is None:
             raise ValueError("Model has not been fitted yet. call 'fit first.")
         if mat.shape[1] != self.centroids.shape[1]:
             raise ValueError("Feature mismatch: input data must have the same number of features as training data. ")
-    
-        distances = cdist(mat, self.centroids)
-        return np.argmin(distances, axis = 1)
 
+        #the index is built on the first call and kept until fit/partial_fit move the centroids
+        return self.predictor().predict(mat)
+
+    def predict_iter(self, chunks, return_distances: bool = False, prefetch_depth: int = 1):
+        """
+        labels data that arrives in chunks with bounded memory, reading the next chunk on a background
+        thread while the current one is labelled (see KMeansPredictor.predict_iter). it works on a
+        snapshot of the centroids taken when it is called.
+
+        inputs:
+            chunks: iterable
+                2D arrays, np.memmap slices or paths of .npy files
+            return_distances: bool
+                if True every step yields (labels, distances) with the `chunk x k` euclidean distances
+            prefetch_depth: int
+                how many chunks are read ahead
+
+        outputs:
+            generator
+                the labels of every chunk (or (labels, distances)), in order
+        """
+        return self.predictor().predict_iter(chunks, return_distances, prefetch_depth)
+
+    def transform_iter(self, chunks, prefetch_depth: int = 1):
+        """
+        same as predict_iter() but yields only the `chunk x k` euclidean distances of every chunk
+        """
+        return self.predictor(index="gemm").transform_iter(chunks, prefetch_depth)
+
+    def predictor(self, index: str = "auto") -> KMeansPredictor:
+        """
+        returns a read-only KMeansPredictor over a snapshot of the current centroids, for answering many
+        predict calls without re-validating the model every time (see cluster/predictor.py).
+        the "auto" predictor is built once and shared with predict() until the centroids change (by
+        fit/partial_fit or by assigning to `centroids`), a predictor that was handed out keeps answering
+        with the centroids it was built from.
+
+        inputs:
+            index: str
+                "auto", "kdtree" or "gemm", see KMeansPredictor
+        """
+        if self.centroids is None:
+            raise ValueError("Model has not been fitted yet. call 'fit first.")
+        if index != "auto":
+            return KMeansPredictor(self.centroids, index=index, dtype=self.dtype)
+        #two threads may both build it the first time, they build the same index and one of them is kept
+        predictor = self._predictor
+        #centroids is a public attribute, a caller may have replaced or edited it since the index was built.
+        #comparing costs one pass over the k x m centroids, a lot less than building the index again
+        if (predictor is None
+                or predictor.centroids.shape != self.centroids.shape
+                or not np.array_equal(predictor.centroids, self.centroids)):
+            predictor = self._predictor = KMeansPredictor(self.centroids, index="auto", dtype=self.dtype)
+        return predictor
+
+
+    def save(self, path):
+        """
+        saves the model to the directory `path`: the centroids, labels, per-cluster inertia and the
+        running counts of partial_fit as .npy files, the parameters, inertia, inertia history and fit
+        counters in params.json (see cluster/io.py). the distances of the last fit and the
+        callback are not saved.
+
+        inputs:
+            path: str or os.PathLike
+                the directory to write to, created if it does not exist
+        """
+        if self.centroids is None:
+            raise ValueError("Model has not been fitted yet. call 'fit first.")
+        if isinstance(self.random_state, np.random.Generator):
+            raise ValueError("a model seeded with a np.random.Generator can not be saved, use an int seed.")
+
+        init_is_array = isinstance(self.init, np.ndarray)
+        params = {
+            "k": self.k,
+            "tol": self.tol,
+            "max_iter": self.max_iter,
+            "algorithm": self.algorithm,
+            "batch_size": self.batch_size,
+            "n_jobs": self.n_jobs,
+            "empty_cluster": self.empty_cluster,
+            "init": None if init_is_array else self.init,
+            "n_init": self.n_init,
+            "random_state": self.random_state,
+            "dtype": self.dtype.name,
+            "convergence": self.convergence,
+            "inertia_": self.inertia_,
+            "inertia_history_": self.inertia_history_,
+            "n_distance_evals_": None if self.n_distance_evals_ is None else int(self.n_distance_evals_),
+            "n_iter_": self.n_iter_,
+            "converged_": self.converged_,
+            "timings_": self.timings_,
+        }
+        arrays = {
+            "centroids": self.centroids,
+            "labels": self.labels,
+            "cluster_inertia": self.cluster_inertia_,
+            "counts": self._counts,
+            "init": self.init if init_is_array else None,
+        }
+        save_arrays(path, arrays, params)
+
+    @classmethod
+    def load(cls, path, mmap_mode: str = "c"):
+        """
+        loads a model written by save(). the arrays are memory mapped, so loading takes milliseconds and
+        processes that load the same model share its pages.
+
+        inputs:
+            path: str or os.PathLike
+                the directory the model was saved to
+            mmap_mode: str
+                "c" (copy on write) maps the files but lets partial_fit change the centroids in memory,
+                "r" maps them read-only and None reads everything into memory
+
+        outputs:
+            KMeans
+                the fitted model
+        """
+        arrays, params = load_arrays(path, mmap_mode=mmap_mode)
+        fitted = {
+            name: params.pop(name, None)
+            for name in ("inertia_", "inertia_history_", "n_distance_evals_", "n_iter_", "converged_", "timings_")}
+        if params["init"] is None:
+            params["init"] = np.asarray(arrays["init"])
+
+        model = cls(**params)
+        model.centroids = arrays["centroids"]
+        model._predictor = None
+        model.labels = arrays.get("labels")
+        model.cluster_inertia_ = arrays.get("cluster_inertia")
+        model._counts = arrays.get("counts")
+        for name, value in fitted.items():
+            setattr(model, name, value)
+        return model
 
     def get_error(self) -> float:
         """
@@ -147,13 +1271,17 @@ class KMeans:
             float
                 the squared-mean error of the fit model
         """
-        if self.labels is None:
-            raise ValueError
-        
-        #compute the squared mean error, which calculates how far each data point is from its assigned centroid. 
-        #the smaller the error, the tighter the cluster. 
-        error = np.sum((cdist(self.centroids, self.centroids[self.labels])**2)) / len(self.labels)
-        return error
+        if self.centroids is None:
+            raise ValueError("Model has not been fitted yet. call 'fit first.")
+        if self.inertia_ is None:
+            #fit_batches/partial_fit see every batch only once, nothing measures all points against the final centroids
+            raise ValueError(
+                "No inertia was recorded: the centroids were last updated by partial_fit or fit_batches, "
+                "which never see all the data at once. call fit (batch_size works on a np.memmap) to get the error.")
+
+        #the squared mean error is the mean squared distance of every data point to its assigned centroid.
+        #the smaller the error, the tighter the cluster. fit recorded the sum, so nothing is recomputed here.
+        return self.inertia_ / len(self.labels)
 
 
 
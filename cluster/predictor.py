@@ -0,0 +1,183 @@
+import numpy as np
+from .distance import row_norms, assign_labels, error_bound, cdist
+from .io import prefetch
+
+'''
+KMeans.predict() checks its input and the model on every call and works on centroids that a later
+fit/partial_fit can still change. for serving, the predictor takes a snapshot of the centroids once,
+builds an index over them and then only answers queries.
+
+which index is faster depends on the shape of the problem (measured on 20k queries):
+- a kd-tree (scipy cKDTree) only visits the centroids near a query, which wins by 10-50x for
+  many centroids in few dimensions (k = 10000, m = 2-4), but in high dimensions it ends up visiting
+  almost every centroid and is 5-10x slower than brute force (m = 32).
+- the matrix product kernel of cluster/distance.py compares a block of queries to all centroids in one
+  BLAS call with the centroid norms cached, which wins everywhere else.
+'''
+
+#number of query x centroid distances computed at once by the matrix product index (32MB in float64),
+#so that a large batch against 10k+ centroids does not allocate a huge n x k matrix
+_BLOCK_ELEMENTS = 2**22
+
+
+class KMeansPredictor:
+    #no __dict__: less memory per instance, faster attribute lookups and no attributes can be added by accident
+    __slots__ = ("centroids", "k", "n_features", "dtype", "index", "_centroid_norms", "_tree", "_block_rows")
+
+    def __init__(self, centroids: np.ndarray, index: str = "auto", dtype=np.float64):
+        """
+        a read-only nearest centroid lookup
+
+        inputs:
+            centroids: np.ndarray
+                a `k x m` matrix of centroids, it is copied so later changes to it do not matter
+            index: str
+                "kdtree" queries a kd-tree over the centroids, "gemm" compares against all centroids with
+                one matrix product per block of queries, "auto" picks the kd-tree for few features and
+                many centroids (m <= 8 and k >= 128) and "gemm" otherwise
+            dtype: np.float64 or np.float32
+                the precision of the "gemm" index, the labels are exact in both
+        """
+        if not isinstance(centroids, np.ndarray) or centroids.ndim != 2 or centroids.shape[0] == 0:
+            raise ValueError("centroids must be a non-empty 2D numpy array.")
+        if index not in ("auto", "kdtree", "gemm"):
+            raise ValueError("index must be 'auto', 'kdtree' or 'gemm'.")
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("dtype must be np.float32 or np.float64.")
+
+        k, n_features = centroids.shape
+        if index == "auto":
+            index = "kdtree" if n_features <= 8 and k >= 128 else "gemm"
+
+        #the kd-tree computes its distances in float64 anyway
+        dtype = np.dtype(np.float64 if index == "kdtree" else dtype)
+        centroids = np.array(centroids, dtype=dtype)
+        centroids.flags.writeable = False
+        norms = row_norms(centroids)
+        norms.flags.writeable = False
+
+        set_slot = object.__setattr__
+        set_slot(self, "centroids", centroids)
+        set_slot(self, "k", k)
+        set_slot(self, "n_features", n_features)
+        set_slot(self, "dtype", dtype)
+        set_slot(self, "index", index)
+        set_slot(self, "_centroid_norms", norms)
+        if index == "kdtree":
+            #scipy is only imported when a kd-tree is actually built
+            from scipy.spatial import cKDTree
+            set_slot(self, "_tree", cKDTree(centroids))
+        else:
+            set_slot(self, "_tree", None)
+        set_slot(self, "_block_rows", max(1, _BLOCK_ELEMENTS // k))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("KMeansPredictor is read-only, build a new one from the updated centroids.")
+
+    def __delattr__(self, name):
+        raise AttributeError("KMeansPredictor is read-only, build a new one from the updated centroids.")
+
+    def __repr__(self) -> str:
+        return f"KMeansPredictor(k={self.k}, n_features={self.n_features}, index='{self.index}')"
+
+    def predict(self, mat: np.ndarray) -> np.ndarray:
+        """
+        returns the index of the closest centroid for every row of `mat`. only the shape is checked.
+
+        inputs:
+            mat: np.ndarray
+                a `n x m` 2D matrix of observations
+
+        outputs:
+            np.ndarray
+                a 1D array with the cluster label for each of the observations in `mat`
+        """
+        mat = np.asarray(mat, dtype=self.dtype)
+        if mat.ndim != 2 or mat.shape[1] != self.n_features:
+            raise ValueError(f"Input data must be a 2D array with {self.n_features} columns.")
+
+        if self._tree is not None:
+            return self._tree.query(mat)[1].astype(np.intp, copy=False)
+
+        labels = np.empty(mat.shape[0], dtype=np.intp)
+        #one distance buffer is reused by every block
+        buffer = np.empty((min(self._block_rows, mat.shape[0]), self.k), dtype=self.dtype)
+        for start in range(0, mat.shape[0], self._block_rows):
+            block = mat[start:start + self._block_rows]
+            assign_labels(
+                block, self.centroids,
+                C_norms=self._centroid_norms,
+                out=buffer[:len(block)],
+                labels=labels[start:start + len(block)])
+        return labels
+
+    def transform(self, mat: np.ndarray) -> np.ndarray:
+        """
+        returns the `n x k` euclidean distances of every row of `mat` to every centroid
+        """
+        return self._labels_and_distances(mat)[1]
+
+    def predict_iter(self, chunks, return_distances: bool = False, prefetch_depth: int = 1):
+        """
+        labels data that arrives in chunks, e.g. files or slices of a np.memmap too large for memory.
+        the next chunks are read on a background thread while the current one is labelled, and only
+        the current chunk and its results are held (memory ~ chunk size x k with distances).
+
+        inputs:
+            chunks: iterable
+                2D arrays with `n_features` columns, np.memmap slices or paths of .npy files
+            return_distances: bool
+                if True every step yields (labels, distances) with the `chunk x k` euclidean distances
+            prefetch_depth: int
+                how many chunks are read ahead
+
+        outputs:
+            generator
+                the labels of every chunk (or (labels, distances)), in order
+        """
+        for chunk in prefetch(chunks, prefetch_depth):
+            if return_distances:
+                yield self._labels_and_distances(chunk)
+            else:
+                yield self.predict(chunk)
+
+    def transform_iter(self, chunks, prefetch_depth: int = 1):
+        """
+        same as predict_iter() but yields only the `chunk x k` euclidean distances of every chunk
+        """
+        for chunk in prefetch(chunks, prefetch_depth):
+            yield self.transform(chunk)
+
+    def _labels_and_distances(self, mat: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        returns the labels and all `n x k` euclidean distances of `mat`, computed with the cached centroid norms
+        """
+        mat = np.asarray(mat, dtype=self.dtype)
+        if mat.ndim != 2 or mat.shape[1] != self.n_features:
+            raise ValueError(f"Input data must be a 2D array with {self.n_features} columns.")
+        labels, distances = assign_labels(mat, self.centroids, C_norms=self._centroid_norms)
+        return labels, np.sqrt(distances, out=distances)
+
+    def predict_one(self, row: np.ndarray) -> int:
+        """
+        returns the index of the closest centroid for a single observation (1D array of length m),
+        without the block bookkeeping of predict()
+        """
+        row = np.asarray(row, dtype=self.dtype)
+        if row.shape != (self.n_features,):
+            raise ValueError(f"Input must be a 1D array of length {self.n_features}.")
+
+        if self._tree is not None:
+            return int(self._tree.query(row)[1])
+
+        #||x||^2 is the same for every centroid, so it does not change which one is closest
+        distances = self._centroid_norms - 2 * (self.centroids @ row)
+        label = int(np.argmin(distances))
+        if self.k > 1:
+            closest, second = np.partition(distances, 1)[:2]
+            bound = error_bound(row_norms(row[None, :]), self._centroid_norms, self.n_features, self.dtype)[0]
+            if second - closest <= 2 * bound:
+                #too close to call in this precision, same exact fallback as assign_labels
+                exact = cdist(row[None, :].astype(np.float64), self.centroids.astype(np.float64), "sqeuclidean")
+                label = int(np.argmin(exact))
+        return label
@@ -1,28 +1,111 @@
 import numpy as np
-from scipy.spatial.distance import cdist
+from .distance import row_norms, euclidean_distances
+from .io import load_matrix
 
-#this score is a metrix used to measure how well a data point fits within it assigned 
+#this score is a metrix used to measure how well a data point fits within it assigned
 #cluster compared to other clusters. it ranges from -1 to 1,
 #where 1 data point is well clustered (far from other clusters)
 #0 data point is on the border between two clusters
 #-1 data point is misclassified, closer to another cluster than its own!
 
+#number of resampled scores drawn at once by the bootstrap of score_sample (8MB of indices)
+_BOOTSTRAP_BLOCK_ELEMENTS = 2**20
+
+#number of values of the reference points gathered and centered at once (32MB in float64), so a
+#memory mapped X is read chunk by chunk instead of copied into memory as a whole
+_REFERENCE_BLOCK_ELEMENTS = 2**18
+
+def _scores_from_sums(
+        cluster_sums: np.ndarray,
+        own: np.ndarray,
+        ref_sizes: np.ndarray,
+        cluster_sizes: np.ndarray,
+        in_reference: np.ndarray) -> np.ndarray:
+    """
+    turns the per-cluster distance sums of some points (rows x clusters) into their silhouette scores.
+    `own` is the cluster of each point, `ref_sizes` the number of reference points per cluster,
+    `cluster_sizes` the true cluster sizes and `in_reference` tells if a point is a reference point itself.
+    """
+    rows = np.arange(len(own))
+
+    #a(i): the distance of point i to itself is 0, so the sum over its own cluster
+    #only needs to be divided by the number of other points in that cluster.
+    a = cluster_sums[rows, own] / np.maximum(ref_sizes[own] - in_reference, 1)
+
+    #b(i): the smallest mean distance to any other cluster, own cluster is masked with inf
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_distances = cluster_sums / ref_sizes
+    mean_distances[rows, own] = np.inf
+    mean_distances[:, ref_sizes == 0] = np.inf #clusters without reference points can not be compared against
+    b = mean_distances.min(axis=1)
+
+    """
+    a point alone in its cluster gets a score of 0 (same convention as sklearn), and so does
+    every point when there is only a single cluster (b is inf) or when a and b are both 0.
+    """
+    denominator = np.maximum(a, b)
+    valid = (cluster_sizes[own] > 1) & np.isfinite(b) & (denominator > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(valid, (b - a) / denominator, 0)
+
+
 class Silhouette:
-    def __init__(self):
+    def __init__(self, block_size: int = None, max_memory: int = 2**27, dtype=np.float64):
         """
         inputs:
-            none
-        we are initializing the class, no inputs required
+            block_size: int
+                the number of rows of `X` scored at once, their distances to one chunk of the other
+                points are held in memory. if None it is derived from `max_memory`
+            max_memory: int
+                the approximate number of bytes the distances of a row block to one chunk may use
+                (only used when `block_size` is None, default 128 MB)
+            dtype: np.float64 or np.float32
+                the precision of the distance computations. float32 fits twice the rows in `max_memory`
+                and is about twice as fast, but the scores are only accurate to about 1e-4
+
+        the full n x n distance matrix is never materialized, rows are scored block by block instead.
+        """
+        if block_size is not None and (not isinstance(block_size, int) or block_size <= 0):
+            raise ValueError("block_size must be a positive integer or None.")
+        if not isinstance(max_memory, int) or max_memory <= 0:
+            raise ValueError("max_memory must be a positive integer (bytes).")
+        if np.dtype(dtype) not in (np.float32, np.float64):
+            raise ValueError("dtype must be np.float32 or np.float64.")
+
+        self.block_size = block_size
+        self.max_memory = max_memory
+        self.dtype = np.dtype(dtype)
+
+    def _get_block_size(self, n_rows: int, n_columns: int) -> int:
+        """
+        returns the number of the `n_rows` rows to process per block when every row holds `n_columns` distances
+        """
+        if self.block_size is not None:
+            return min(self.block_size, n_rows)
+        return int(min(max(1, self.max_memory // (n_columns * self.dtype.itemsize)), n_rows))
+
+    def _check_inputs(self, X: np.ndarray, y: np.ndarray) -> (np.ndarray, np.ndarray):
         """
-        pass #no parameters to score
+        returns `X` and `y` (paths of .npy files memory mapped) and raises a ValueError if they can
+        not be scored together
+        """
+        X, y = load_matrix(X), load_matrix(y)
+        if not isinstance(X, np.ndarray) or not isinstance(y, np.ndarray):
+            raise ValueError("X and y must be a NumPy array")
+        if X.ndim != 2 or y.ndim != 1:
+            raise ValueError("X must be a 2D array and y must be a 1D array.")
+        if X.shape[0] != y.shape[0]:
+            raise ValueError("X and y must have the same number of rows (samples).")
+        return X, y
 
     def score(self, X: np.ndarray, y: np.ndarray) -> np.ndarray:
         """
         calculates the silhouette score for each of the observations
 
         inputs:
-            X: np.ndarray
-                A 2D matrix where the rows are observations and columns are features.
+            X: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features,
+                a np.memmap or the path of a .npy file (memory mapped, not read into memory)
 
             y: np.ndarray
                 a 1D array representing the cluster labels for each of the observations in `X`
@@ -31,61 +114,278 @@ class Silhouette:
             np.ndarray
                 a 1D array with the silhouette scores for each of the observations in `X`
         """
-        if not isinstance(X, np.ndarray) or not isinstance(y, np.ndarray):
-            raise ValueError("X and y must be a NumPy array")
-        if X.ndim != 2 or y.ndim != 1:
-            raise ValueError("X must be a 2D array and y must be a 1D array.")
-        if X.shape[0] != y.shape[0]:
-            raise ValueError("X and y must have the same number of rows (samples).")
-        
+        X, y = self._check_inputs(X, y)
+
+        #unique cluster labels, y_idx maps every label onto 0..n_clusters-1
+        unique_labels, y_idx = np.unique(y, return_inverse=True)
+        cluster_sizes = np.bincount(y_idx, minlength=len(unique_labels))
+
+        #every point is scored against every point of X, itself included
+        return self._score_rows(X, y_idx, X, y_idx, cluster_sizes, np.arange(len(X)))
+
+    def score_sample(
+            self,
+            X: np.ndarray,
+            y: np.ndarray,
+            n_samples: int = 1000,
+            n_reference: int = None,
+            n_bootstrap: int = 1000,
+            confidence: float = 0.95,
+            seed: int = None) -> (float, (float, float)):
+        """
+        estimates the mean silhouette score from a stratified sample of the observations
+
+        inputs:
+            X: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features,
+                a np.memmap or the path of a .npy file
+            y: np.ndarray
+                a 1D array representing the cluster labels for each of the observations in `X`
+            n_samples: int
+                the number of observations to score, split across the clusters proportionally to their size
+            n_reference: int
+                if None the sampled points are scored against all of `X`. otherwise each cluster is
+                represented by a random subsample of at most `n_reference` of its points
+            n_bootstrap: int
+                the number of bootstrap resamples used for the confidence interval
+            confidence: float
+                the coverage of the confidence interval, between 0 and 1
+            seed: int
+                seed for the random generator, the same seed always gives the same estimate
+
+        outputs:
+            (float, (float, float))
+                the estimated mean silhouette score and the (lower, upper) bounds of its bootstrap confidence interval
+        """
+        X, y = self._check_inputs(X, y)
+        if not isinstance(n_samples, int) or n_samples <= 0:
+            raise ValueError("n_samples must be a positive integer.")
+        if n_reference is not None and (not isinstance(n_reference, int) or n_reference <= 0):
+            raise ValueError("n_reference must be a positive integer or None.")
+        if not isinstance(n_bootstrap, int) or n_bootstrap <= 0:
+            raise ValueError("n_bootstrap must be a positive integer.")
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1.")
+
+        rng = np.random.default_rng(seed)
+        n_total = X.shape[0]
+
+        unique_labels, y_idx = np.unique(y, return_inverse=True)
+        n_clusters = len(unique_labels)
+        cluster_sizes = np.bincount(y_idx, minlength=n_clusters)
+
+        """
+        stratified sampling: every cluster gets a share of the sample proportional to its size,
+        with at least one point each so small clusters are not missed entirely.
+        """
+        members = np.split(np.argsort(y_idx, kind="stable"), np.cumsum(cluster_sizes)[:-1])
+        n_per_cluster = np.maximum(1, np.round(n_samples * cluster_sizes / n_total).astype(int))
+        n_per_cluster = np.minimum(n_per_cluster, cluster_sizes)
+        strata = [rng.choice(idx, size=n_c, replace=False) for idx, n_c in zip(members, n_per_cluster)]
+        sample = np.concatenate(strata)
+
+        if n_reference is None:
+            #every point of X is a reference point
+            reference = None
+            self_index = sample
+        else:
+            reference = np.concatenate([
+                idx if len(idx) <= n_reference else rng.choice(idx, size=n_reference, replace=False)
+                for idx in members])
+            #position of every sampled point among the reference points, -1 if it is not one of them
+            position = np.full(n_total, -1)
+            position[reference] = np.arange(len(reference))
+            self_index = position[sample]
+
+        #the reference points are gathered from X chunk by chunk, a memory mapped X is not copied
+        scores = self._score_rows(
+            X[sample], y_idx[sample], X, y_idx if reference is None else y_idx[reference],
+            cluster_sizes, self_index, ref_rows=reference)
+
+        """
+        every sampled point stands in for cluster_size / n_sampled points of its cluster, so the
+        weighted mean is unbiased even when the rounding of the strata is off by a point.
+        the bootstrap resamples within each stratum to keep that design.
+        """
+        bounds = np.cumsum(n_per_cluster)[:-1]
+        weights = cluster_sizes / n_total
+        stratum_scores = np.split(scores, bounds)
+        estimate = float(sum(w * s.mean() for w, s in zip(weights, stratum_scores)))
+
+        boot_means = np.zeros(n_bootstrap)
+        for w, s in zip(weights, stratum_scores):
+            #a few resamples at a time, so memory does not grow with n_bootstrap x len(s)
+            step = max(1, _BOOTSTRAP_BLOCK_ELEMENTS // len(s))
+            for start in range(0, n_bootstrap, step):
+                rows = min(step, n_bootstrap - start)
+                resampled = rng.integers(0, len(s), size=(rows, len(s)))
+                boot_means[start:start + rows] += w * s[resampled].mean(axis=1)
+
+        alpha = (1 - confidence) / 2
+        low, high = np.quantile(boot_means, [alpha, 1 - alpha])
+        return estimate, (float(low), float(high))
+
+    def score_simplified(
+            self,
+            X: np.ndarray = None,
+            y: np.ndarray = None,
+            centroids: np.ndarray = None,
+            kmeans=None) -> np.ndarray:
+        """
+        calculates the simplified (centroid based) silhouette score for each of the observations.
+        a(i) is the distance of a point to its own centroid and b(i) the distance to the closest other
+        centroid, so this runs in O(n*k) instead of O(n^2).
+
+        inputs:
+            X: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features,
+                a np.memmap or the path of a .npy file.
+                can be left out when `kmeans` is given, the distances of its last fit are reused then
+                (lloyd fits that converged, after max_iter the centroids moved past those distances)
+            y: np.ndarray
+                a 1D array with the centroid index (0..k-1) of each observation.
+                if None every observation is assigned to its closest centroid. without `X` the labels
+                of the fit are used and `y` must be None
+            centroids: np.ndarray
+                a `k x m` 2D matrix of cluster centroids
+            kmeans: KMeans
+                a fitted KMeans model, used instead of `centroids`
+
+        outputs:
+            np.ndarray
+                a 1D array with the simplified silhouette scores for each of the observations
+        """
+        if (kmeans is None) == (centroids is None):
+            raise ValueError("Provide exactly one of centroids or kmeans.")
+
+        if kmeans is not None:
+            if kmeans.labels is None:
+                raise ValueError("KMeans model has not been fitted yet. call 'fit' first.")
+            centroids = kmeans.centroids
+
+        if X is not None:
+            X = load_matrix(X)
+            if not isinstance(X, np.ndarray) or X.ndim != 2:
+                raise ValueError("X must be a 2D NumPy array.")
+            if X.shape[1] != centroids.shape[1]:
+                raise ValueError("X and centroids must have the same number of features.")
+            distances = euclidean_distances(np.asarray(X, dtype=self.dtype), np.asarray(centroids, dtype=self.dtype))
+        elif kmeans is not None and kmeans._own_distances is not None:
+            if y is not None:
+                raise ValueError("y can only be given together with X, the fit's own labels are used otherwise.")
+            #the fit kept the distances of every training point to its own and to the closest other centroid
+            if kmeans.k < 2:
+                return np.zeros(len(kmeans._own_distances))
+            return self._simplified_scores(kmeans._own_distances, kmeans._other_distances)
+        else:
+            raise ValueError(
+                "X is required unless a KMeans model fitted with algorithm='lloyd' that converged before max_iter is given.")
+
+        if y is None:
+            y = np.argmin(distances, axis=1)
+        if not isinstance(y, np.ndarray) or y.ndim != 1 or len(y) != distances.shape[0]:
+            raise ValueError("y must be a 1D array with one label per observation.")
+
+        n_clusters = distances.shape[1]
+        if n_clusters < 2:
+            return np.zeros(distances.shape[0]) #no other cluster to compare against
+
+        rows = np.arange(distances.shape[0])
+        a = distances[rows, y]
+
+        #mask the own centroid with inf to find the closest other one
+        other = distances.copy()
+        other[rows, y] = np.inf
+        b = other.min(axis=1)
+        return self._simplified_scores(a, b)
+
+    def _simplified_scores(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
         """
-        Compute pairwise distances between all points
-        necessary to efficiently calculate the average intra-cluster distance (how close a point is to others in its cluster)
-        and the average nearest-cluster distance (how far a point is from the closest other cluster)
-        each row represents a data point, each column represents the distance to every other poin
+        returns (b - a) / max(a, b) for the distances `a` to the own and `b` to the closest other centroid
         """
-        distances = cdist(X, X)
+        denominator = np.maximum(a, b)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(denominator > 0, (b - a) / denominator, 0)
 
-        #unique cluster labels
-        unique_labels = np.unique(y)
+    def _score_rows(
+            self,
+            X_rows: np.ndarray,
+            row_labels: np.ndarray,
+            X_ref: np.ndarray,
+            ref_labels: np.ndarray,
+            cluster_sizes: np.ndarray,
+            self_index: np.ndarray,
+            ref_rows: np.ndarray = None) -> np.ndarray:
+        """
+        scores the points `X_rows` against the reference points `X_ref` (only its rows `ref_rows` if given).
+        labels are cluster indices 0..n_clusters-1, `cluster_sizes` are the true cluster sizes and
+        `self_index` is the row of each point in `X_ref`, or -1 if it is not a reference point
+        (its distance of 0 to itself then must not count towards a(i)).
 
-        #Initialize silhouette scores array 
-        silhouette_scores = np.zeros(len(X))
+        instead of computing all pairwise distances at once (n x n, 80 GB for 100k points) we take
+        a block of rows, compute their distances to every reference point and reduce them right away
+        into per-cluster distance sums. only the block x n matrix is ever held in memory.
+        the reference points are read in chunks as well, so `X_ref` can be a np.memmap that is never
+        copied into memory as a whole.
+        """
+        n_rows = X_rows.shape[0]
+        n_clusters = len(cluster_sizes)
+        ref_sizes = np.bincount(ref_labels, minlength=n_clusters)
+        n_ref = len(ref_labels)
+        in_reference = self_index >= 0
 
-        for i, point in enumerate(X):
-            cluster = y[i] #get the cluster of the current point
+        """
+        the reference points are read in contiguous chunks in their own order (slices of a memmap
+        read the file front to back). the distances of a chunk are reduced into per-cluster sums with
+        one matrix product against the one-hot labels of the chunk, a BLAS call instead of a boolean
+        mask for every point and every cluster. a chunk holds at most _REFERENCE_BLOCK_ELEMENTS values
+        of the data and of its one-hot labels.
+        """
+        chunk_size = max(1, min(n_ref, _REFERENCE_BLOCK_ELEMENTS // max(X_ref.shape[1], n_clusters)))
 
-            """
-            compute the average intra-cluster distance
-            y == cluster creates a Boolean mask that selects only the other points in the same cluster.
-            np.arange(len(y) != i) ensures point i is excluded from its own cluster calculations.
-            """ 
-            in_cluster = (y == cluster) & (np.arange(len(y)) != i) #identifies all points belonging to the same cluster as point i, excluding itself.
-            if np.sum(in_cluster) > 0:
-                a_i = np.mean(distances[i, in_cluster])
-            else:
-                a_i = 0 #if its the only point in the cluster, set a(i) to 0. 
-            
-            """
-            compute b(i), which is the average inter-cluster distance (nearest neighbor cluster)
-            """
-            b_i = np.inf #start with a large number
+        def reference_chunk(first, last):
+            return X_ref[first:last] if ref_rows is None else X_ref[ref_rows[first:last]]
 
-            for other_cluster in unique_labels:
-                if other_cluster == cluster:
-                    continue #skip own cluster
+        """
+        distances come from the matrix product expansion in cluster/distance.py. its error grows with
+        the norm of the points, and distances do not change when every point is shifted by the same
+        amount, so the data is centered first (chunk by chunk, the mean is one pass over the reference points).
+        """
+        center = sum(
+            reference_chunk(first, first + chunk_size).sum(axis=0, dtype=np.float64)
+            for first in range(0, n_ref, chunk_size)) / n_ref
 
-                out_cluster = (y == other_cluster)
-                mean_distance = np.mean(distances[i, out_cluster])
+        #Initialize silhouette scores array
+        silhouette_scores = np.zeros(n_rows)
 
-                if mean_distance < b_i:
-                    b_i = mean_distance #keep the smallest inter cluster distance
-                
-                silhouette_scores[i] = (b_i - a_i) / max(a_i, b_i)
-            
-            return silhouette_scores
+        #every row of a block holds the distances to one chunk
+        block_size = self._get_block_size(n_rows, chunk_size)
+        for start in range(0, n_rows, block_size):
+            stop = min(start + block_size, n_rows)
+            own = row_labels[start:stop] #cluster of every point in the block
+            block = np.asarray(X_rows[start:stop] - center, dtype=self.dtype)
+            block_norms = row_norms(block)
+            block_self = np.where(in_reference[start:stop], self_index[start:stop], -1)
 
-            
+            #sum of distances from each point in the block to all members of each cluster, added up over
+            #the chunks in float64, so float32 does not lose precision over large clusters
+            cluster_sums = np.zeros((stop - start, n_clusters))
+            for first in range(0, n_ref, chunk_size):
+                last = min(first + chunk_size, n_ref)
+                X_chunk = np.asarray(reference_chunk(first, last) - center, dtype=self.dtype)
+                #each row represents a data point of the block, each column the distance to a reference point of the chunk
+                distances = euclidean_distances(block, X_chunk, X_norms=block_norms)
+                #a point's distance to itself is exactly 0, not whatever rounding left over
+                here = np.flatnonzero((block_self >= first) & (block_self < last))
+                distances[here, block_self[here] - first] = 0
 
+                one_hot = np.zeros((last - first, n_clusters), dtype=self.dtype)
+                one_hot[np.arange(last - first), ref_labels[first:last]] = 1
+                cluster_sums += distances @ one_hot
+                #freed before the next chunk allocates its distances, so only one chunk's are ever held
+                del distances
 
+            silhouette_scores[start:stop] = _scores_from_sums(
+                cluster_sums, own, ref_sizes, cluster_sizes, in_reference[start:stop])
 
+        return silhouette_scores
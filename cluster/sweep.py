@@ -0,0 +1,248 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .kmeans import KMeans, KMeansWorkspace, _kmeans_plusplus
+from .silhouette import Silhouette, _scores_from_sums
+from .distance import euclidean_distances
+from .io import load_matrix
+
+'''
+choosing k means fitting KMeans and scoring it for every candidate k. done one by one, every fit
+validates and converts the data again, allocates its own buffers and every silhouette score
+recomputes the pairwise distances. the sweep does all of that once and reuses it for every k.
+'''
+
+class KMeansSweep:
+    def __init__(
+            self,
+            ks,
+            silhouette: str = "sampled",
+            n_samples: int = 1000,
+            n_reference: int = 5000,
+            warm_start: bool = True,
+            n_jobs: int = 1,
+            random_state: int = 42,
+            **kmeans_params):
+        """
+        inputs:
+            ks: iterable of int
+                the numbers of clusters to try
+            silhouette: str or None
+                how every fit is scored. "sampled" scores `n_samples` random points against `n_reference`
+                random points, with their distances computed once for all k. "simplified" uses the
+                centroid based score, "exact" the full Silhouette().score (O(n^2)) and None skips scoring
+            n_samples: int
+                number of points scored by the "sampled" silhouette
+            n_reference: int
+                number of reference points of the "sampled" silhouette, None uses all of the data
+            warm_start: bool
+                if True the ks are fit in increasing order and every fit starts from the centroids of the
+                previous one plus k-means++ draws for the extra centroids. the fits then depend on each
+                other, so `n_jobs` threads are used inside every fit. if False the fits start from scratch
+                and up to `n_jobs` of them run at the same time
+            n_jobs: int
+                number of threads, -1 uses all cores
+            random_state: int
+                seed for the silhouette sample and the warm start draws, also passed on to KMeans
+            kmeans_params:
+                any other KMeans parameter (tol, max_iter, algorithm, init, dtype, ...)
+        """
+        ks = sorted(set(ks))
+        if len(ks) == 0 or not all(isinstance(k, int) and k > 0 for k in ks):
+            raise ValueError("ks must be a non-empty collection of positive integers.")
+        if silhouette not in ("sampled", "simplified", "exact", None):
+            raise ValueError("silhouette must be 'sampled', 'simplified', 'exact' or None.")
+        if not isinstance(n_samples, int) or n_samples <= 0:
+            raise ValueError("n_samples must be a positive integer.")
+        if n_reference is not None and (not isinstance(n_reference, int) or n_reference <= 0):
+            raise ValueError("n_reference must be a positive integer or None.")
+        if not isinstance(n_jobs, int) or (n_jobs <= 0 and n_jobs != -1):
+            raise ValueError("n_jobs must be a positive integer or -1.")
+
+        self.ks = ks
+        self.silhouette = silhouette
+        self.n_samples = n_samples
+        self.n_reference = n_reference
+        self.warm_start = warm_start
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.random_state = random_state
+        #KMeans checks its own parameters, building one here reports mistakes before any work is done
+        KMeans(k=ks[0], random_state=random_state, **kmeans_params)
+        self.kmeans_params = kmeans_params
+
+        self.models = None
+        self.results = None
+
+    def fit(self, mat: np.ndarray):
+        """
+        fits and scores KMeans for every k. afterwards `models` maps every k to its fitted KMeans and
+        `results` maps every k to a dict with its `inertia`, `silhouette` (mean score, None if not scored),
+        `fit_time` and `score_time` in seconds.
+
+        inputs:
+            mat: np.ndarray or str
+                A 2D matrix where the rows are observations and columns are features, a np.memmap or the
+                path of a .npy file
+        outputs:
+            KMeansSweep
+                the sweep itself
+        """
+        mat = load_matrix(mat)
+        if not isinstance(mat, np.ndarray) or mat.ndim != 2:
+            raise ValueError("Input data must be a 2-D numpy array.")
+        n_samples, n_features = mat.shape
+        if n_samples < self.ks[-1]:
+            raise ValueError("The number of observations must be at least the largest k.")
+
+        #validate and convert the data once, every fit then gets it as is
+        dtype = np.dtype(self.kmeans_params.get("dtype", np.float64))
+        mat = np.asarray(mat, dtype=dtype)
+        rng = np.random.default_rng(self.random_state)
+
+        scorer = self._prepare_silhouette(mat, rng) if self.silhouette == "sampled" else None
+
+        fits = self._fit_warm(mat, rng) if self.warm_start else self._fit_parallel(mat)
+
+        self.models, self.results = {}, {}
+        for k, model, fit_time in fits:
+            start = time.perf_counter()
+            score = self._score(mat, model, scorer)
+            self.models[k] = model
+            self.results[k] = {
+                "inertia": model.inertia_,
+                "silhouette": score,
+                "fit_time": fit_time,
+                "score_time": time.perf_counter() - start,
+            }
+        return self
+
+    def best_k(self, criterion: str = "silhouette") -> int:
+        """
+        returns the k with the highest mean silhouette score (criterion "silhouette"), or the k at the
+        elbow of the inertia curve, i.e. where its log bends the most (criterion "inertia")
+        """
+        if self.results is None:
+            raise ValueError("The sweep has not been fitted yet. call 'fit' first.")
+        if criterion == "silhouette":
+            if self.silhouette is None:
+                raise ValueError("The sweep was run without silhouette scoring.")
+            return max(self.ks, key=lambda k: self.results[k]["silhouette"])
+        if criterion == "inertia":
+            if len(self.ks) < 3:
+                return self.ks[0]
+            inertia = np.array([self.results[k]["inertia"] for k in self.ks], dtype=np.float64)
+            #largest second difference of the log = sharpest bend of the curve. on the log scale a drop
+            #counts relative to the inertia left, otherwise the big drops of the smallest ks always win
+            log_inertia = np.log(np.maximum(inertia, np.finfo(np.float64).tiny))
+            return self.ks[1 + int(np.argmax(log_inertia[:-2] - 2 * log_inertia[1:-1] + log_inertia[2:]))]
+        raise ValueError("criterion must be 'silhouette' or 'inertia'.")
+
+    def _fit_warm(self, mat: np.ndarray, rng: np.random.Generator):
+        """
+        fits the ks in increasing order, each one starting from the previous solution, all in one workspace.
+        yields (k, model, fit time) for every k
+        """
+        workspace = KMeansWorkspace(mat.shape[0], self.ks[-1], mat.shape[1], mat.dtype)
+        if self.kmeans_params.get("algorithm", "lloyd") == "lloyd":
+            #the row norms of the data are the same for every k
+            workspace.precompute_norms(mat)
+
+        previous = None
+        for k in self.ks:
+            start = time.perf_counter()
+            params = dict(self.kmeans_params, random_state=self.random_state, n_jobs=self.n_jobs)
+            if previous is not None:
+                #keep the previous centroids and draw the new ones where the data is worst represented.
+                #the previous fit knows how far every point is from its centroid (lloyd fits that converged),
+                #then only the distances to the newly drawn centroids are computed
+                closest_sq = None if previous._own_distances is None else previous._own_distances.astype(float) ** 2
+                params["init"] = _kmeans_plusplus(
+                    mat, k, rng, centroids=previous.centroids, closest_sq=closest_sq)
+            model = KMeans(k=k, **params)
+            model.fit(mat, workspace=workspace)
+            yield k, model, time.perf_counter() - start
+            previous = model
+
+    def _fit_parallel(self, mat: np.ndarray):
+        """
+        fits every k from scratch, up to n_jobs at the same time. yields (k, model, fit time) for every k
+        """
+        def fit_one(k):
+            start = time.perf_counter()
+            model = KMeans(k=k, **dict(self.kmeans_params, random_state=self.random_state))
+            model.fit(mat)
+            return model, time.perf_counter() - start
+
+        if self.n_jobs > 1:
+            with ThreadPoolExecutor(self.n_jobs) as pool:
+                for k, (model, elapsed) in zip(self.ks, pool.map(fit_one, self.ks)):
+                    yield k, model, elapsed
+        else:
+            for k in self.ks:
+                yield (k, *fit_one(k))
+
+    def _prepare_silhouette(self, mat: np.ndarray, rng: np.random.Generator) -> dict:
+        """
+        picks the sampled and reference points and computes the distances between them once.
+        the sampled points are the first reference points, so each of them is its own reference.
+        """
+        n_total = mat.shape[0]
+        n_reference = n_total if self.n_reference is None else min(self.n_reference, n_total)
+        reference = np.sort(rng.choice(n_total, n_reference, replace=False))
+        sample_position = rng.choice(n_reference, min(self.n_samples, n_reference), replace=False)
+
+        #centering keeps the matrix product distances accurate (see cluster/distance.py)
+        X_ref = mat[reference] - mat[reference].mean(axis=0)
+        distances = euclidean_distances(X_ref[sample_position], X_ref)
+        distances[np.arange(len(sample_position)), sample_position] = 0
+        return {"reference": reference, "sample_position": sample_position, "distances": distances}
+
+    def _score(self, mat: np.ndarray, model: KMeans, scorer: dict) -> float:
+        """
+        returns the mean silhouette score of one fitted model
+        """
+        if self.silhouette is None or model.k < 2:
+            return None if self.silhouette is None else 0.0
+        if self.silhouette == "exact":
+            return float(np.mean(Silhouette().score(mat, model.labels)))
+        if self.silhouette == "simplified":
+            return float(np.mean(Silhouette().score_simplified(
+                None if model._own_distances is not None else mat, kmeans=model)))
+
+        #sampled: only the labels change between the ks, the distances are shared
+        cluster_sizes = np.bincount(model.labels, minlength=model.k)
+        ref_labels = model.labels[scorer["reference"]]
+        one_hot = np.zeros((len(ref_labels), model.k))
+        one_hot[np.arange(len(ref_labels)), ref_labels] = 1
+        cluster_sums = scorer["distances"] @ one_hot
+
+        scores = _scores_from_sums(
+            cluster_sums,
+            ref_labels[scorer["sample_position"]],
+            np.bincount(ref_labels, minlength=model.k),
+            cluster_sizes,
+            np.ones(len(scorer["sample_position"]), dtype=bool))
+        return float(np.mean(scores))
+
+
+def select_k(mat: np.ndarray, ks, criterion: str = "silhouette", **params) -> (int, dict):
+    """
+    runs a KMeansSweep over `ks` and returns the best k together with the per-k results
+
+    inputs:
+        mat: np.ndarray
+            A 2D matrix where the rows are observations and columns are features
+        ks: iterable of int
+            the numbers of clusters to try
+        criterion: str
+            "silhouette" or "inertia", see KMeansSweep.best_k
+        params:
+            any KMeansSweep or KMeans parameter
+
+    outputs:
+        (int, dict)
+            the selected k and the `results` of the sweep
+    """
+    sweep = KMeansSweep(ks, **params).fit(mat)
+    return sweep.best_k(criterion), sweep.results
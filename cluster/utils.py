@@ -1,5 +1,14 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+'''
+matplotlib is only imported by the plotting functions, so generating data (and importing the
+package) does not load it.
+'''
+
+#the noise is drawn in blocks of this many values, each block from its own random stream. the data then
+#only depends on the seed and the shape, no matter if it is made at once, in chunks or into a file
+_BLOCK_ELEMENTS = 2**20
+
 
 def make_clusters(
         n: int = 500, 
@@ -7,7 +16,9 @@ def make_clusters(
         k: int = 3, 
         bounds: tuple = (-10, 10),
         scale: float = 1,
-        seed: int = 42) -> (np.ndarray, np.ndarray):
+        seed: int = 42,
+        dtype=np.float64,
+        path: str = None) -> (np.ndarray, np.ndarray):
     """
     creates some clustered data
 
@@ -23,32 +34,136 @@ def make_clusters(
         scale: float
             standard deviation of normal distribution
         seed: int
-            random seed
+            random seed (a local generator is used, the global numpy random state is not touched)
+        dtype: np.float64 or np.float32
+            the dtype of the data
+        path: str
+            if given the data is written straight into a .npy file at `path` and returned as a
+            np.memmap of it, so data larger than memory can be made (and reloaded with np.load)
 
     outputs:
         (np.ndarray, np.ndarray)
             returns a 2D matrix of `n` observations and `m` features that are clustered into `k` groups
             returns a 1D array of `n` size that defines the cluster origin for each observation
     """
-    np.random.seed(seed)
-    assert k <= n
+    centers, ends, block_rows = _cluster_layout(n, m, k, bounds, seed, dtype)
 
-    labels = np.sort(np.random.randint(0, k, size=n))
-    centers = np.random.uniform(bounds[0], bounds[1], size=(k,m))
-    mat = np.vstack([
-        np.random.normal(
-            loc=centers[idx], 
-            scale=scale, 
-            size=(np.sum(labels==idx), m))
-        for idx in np.arange(0, k)])
+    #one allocation (or file) for the whole matrix, filled block by block
+    if path is None:
+        mat = np.empty((n, m), dtype=dtype)
+    else:
+        mat = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n, m))
+    for start in range(0, n, block_rows):
+        _fill_rows(mat[start:start + block_rows], start, centers, ends, block_rows, scale, seed)
+    if path is not None:
+        mat.flush()
 
+    #the observations are ordered by cluster
+    labels = np.repeat(np.arange(k), np.diff(ends, prepend=0))
     return mat, labels
 
 
+def iter_clusters(
+        n: int = 500,
+        m: int = 2,
+        k: int = 3,
+        bounds: tuple = (-10, 10),
+        scale: float = 1,
+        seed: int = 42,
+        dtype=np.float64,
+        chunk_size: int = 2**16):
+    """
+    yields the data of make_clusters() with the same arguments in chunks of `chunk_size` rows,
+    so only one chunk is in memory at a time
+
+    outputs:
+        generator
+            (chunk, labels) pairs, a 2D matrix of at most `chunk_size` observations and their cluster labels
+    """
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer.")
+    centers, ends, block_rows = _cluster_layout(n, m, k, bounds, seed, dtype)
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        chunk = np.empty((stop - start, m), dtype=dtype)
+        _fill_rows(chunk, start, centers, ends, block_rows, scale, seed)
+        yield chunk, np.searchsorted(ends, np.arange(start, stop), side="right")
+
+
+def _cluster_layout(n: int, m: int, k: int, bounds: tuple, seed, dtype) -> (np.ndarray, np.ndarray, int):
+    """
+    returns the cluster centers, the row at which every cluster ends and the number of rows per noise block
+    """
+    if not (isinstance(n, int) and isinstance(m, int) and isinstance(k, int)) or min(n, m, k) <= 0:
+        raise ValueError("n, m and k must be positive integers.")
+    if k > n:
+        raise ValueError("k can not be larger than n.")
+    if np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError("dtype must be np.float32 or np.float64.")
+
+    rng = np.random.default_rng(_seed_sequence(seed, 0))
+    #cluster sizes as if every observation picked its cluster uniformly at random
+    sizes = rng.multinomial(n, np.full(k, 1 / k))
+    centers = rng.uniform(bounds[0], bounds[1], size=(k, m))
+    return centers, np.cumsum(sizes), max(1, _BLOCK_ELEMENTS // m)
+
+
+def _seed_sequence(seed, *key) -> np.random.SeedSequence:
+    """
+    returns the independent random stream `key` of `seed`
+    """
+    return np.random.SeedSequence(np.random.SeedSequence(seed).entropy if seed is None else seed, spawn_key=key)
+
+
+def _fill_rows(
+        out: np.ndarray,
+        start: int,
+        centers: np.ndarray,
+        ends: np.ndarray,
+        block_rows: int,
+        scale: float,
+        seed):
+    """
+    writes rows `start` to `start + len(out)` of the clustered data into `out`
+    """
+    stop = start + len(out)
+    n_features = out.shape[1]
+    for block in range(start // block_rows, (stop - 1) // block_rows + 1):
+        first = block * block_rows
+        last = min(first + block_rows, ends[-1])
+        rng = np.random.default_rng(_seed_sequence(seed, 1, block))
+        if start <= first and last <= stop and out.dtype == np.float64:
+            #the whole block is wanted, draw it straight into the output
+            rng.standard_normal(out=out[first - start:last - start])
+        else:
+            #the noise is always drawn in float64, so float32 data is the same values rounded
+            noise = rng.standard_normal((last - first, n_features))
+            lo, hi = max(first, start), min(last, stop)
+            out[lo - start:hi - start] = noise[lo - first:hi - first]
+    out *= scale
+
+    #the rows are sorted by cluster, so every cluster is one run of rows that gets its center added
+    first_cluster = np.searchsorted(ends, start, side="right")
+    last_cluster = np.searchsorted(ends, stop - 1, side="right")
+    for cluster in range(first_cluster, last_cluster + 1):
+        lo = max(start, ends[cluster - 1] if cluster > 0 else 0)
+        hi = min(stop, ends[cluster])
+        out[lo - start:hi - start] += centers[cluster].astype(out.dtype)
+
+
+#above this many points the plots draw a stratified sample (mode="auto"), so the render time is bounded
+MAX_PLOT_POINTS = 50000
+
+
 def plot_clusters(
         mat: np.ndarray, 
         labels: np.ndarray, 
-        filename: str =None):
+        filename: str =None,
+        mode: str = "auto",
+        max_points: int = MAX_PLOT_POINTS,
+        dpi: int = 200,
+        seed: int = 0):
     """
     inputs:
         mat: np.ndarray
@@ -56,27 +171,35 @@ def plot_clusters(
         labels: np.ndarray
             a 1D array where each value represents an integer cluster that an observation belongs to
         filename: str
-            an optional value to save a figure to a file
+            an optional value to save a figure to a file. saving never touches the interactive
+            backend, so it also works headless (batch jobs, servers)
+        mode: str
+            "scatter" draws every point, "sample" a stratified sample of `max_points` points that keeps
+            every cluster, "density" bins the points into a 2D grid colored by the most common label
+            (faded where there are few points). "auto" scatters up to `max_points` points and samples above
+        max_points: int
+            the number of points drawn by "sample" and the limit of "auto"
+        dpi: int
+            resolution of the figure
+        seed: int
+            seed of the sample, the same data always gives the same plot
     """
-
-    plt.figure(figsize=(5,5), dpi=200)
-    plt.scatter(
-        mat[:,0], 
-        mat[:,1], 
-        c=labels)
-
-    if filename:
-        plt.savefig(filename)
-    else:
-        plt.show()
-    plt.close()
+    fig = _new_figure(filename, figsize=(5,5), dpi=dpi)
+    ax = fig.subplots()
+    mode, rows = _plot_rows(labels, mode, max_points, seed)
+    _draw_panel(ax, mat, labels, rows, mode, cmap=None, kind="labels")
+    _finish_figure(fig, filename)
 
 def plot_multipanel(
         mat: np.ndarray,
         truth: np.ndarray,
         pred: np.ndarray,
         score: np.ndarray,
-        filename: str = None):
+        filename: str = None,
+        mode: str = "auto",
+        max_points: int = MAX_PLOT_POINTS,
+        dpi: int = 200,
+        seed: int = 0):
     """
     Plots a multipanel figure visualizing the efficiency of truth, prediction, 
     and silhouette scoring on a provided dataset
@@ -91,27 +214,133 @@ def plot_multipanel(
         score: np.ndarray
             a 1D array where each value represents a float for the silhouette score of that observation
         filename: str
-            an optional value to save a figure to a file
+            an optional value to save a figure to a file (works headless, see plot_clusters)
+        mode: str
+            "auto", "scatter", "sample" or "density", see plot_clusters. the silhouette panel shows the mean
+            score of every bin in "density" mode. all panels show the same sampled points
+        max_points: int
+            the number of points drawn by "sample" and the limit of "auto"
+        dpi: int
+            resolution of the figure
+        seed: int
+            seed of the sample
     """
 
-    fig, axs = plt.subplots(1, 3, figsize=(9,3), dpi=200)
+    fig = _new_figure(filename, figsize=(9,3), dpi=dpi)
+    axs = fig.subplots(1, 3)
+    #the sample is stratified by the true clusters
+    mode, rows = _plot_rows(truth, mode, max_points, seed)
     
     cvars = [truth, pred, score]
     names = ["True Cluster Labels", "Predicted Cluster Labels", "Silhouette Scores"]
     cmaps = [None, None, "seismic"]
+    kinds = ["labels", "labels", "values"]
     for idx, ax in enumerate(axs):
-        sub = ax.scatter(
-            mat[:,0],
-            mat[:,1],
-            c=cvars[idx],
-            cmap=cmaps[idx])
+        sub = _draw_panel(ax, mat, cvars[idx], rows, mode, cmap=cmaps[idx], kind=kinds[idx])
         ax.set_title(names[idx])
         if idx == 2:
-            plt.colorbar(sub, ax=ax)
+            fig.colorbar(sub, ax=ax)
     
-    plt.tight_layout()
+    fig.tight_layout()
+    _finish_figure(fig, filename)
+
+
+def _new_figure(filename: str, figsize: tuple, dpi: int):
+    """
+    returns a figure to draw on. a figure that is only saved is created without pyplot: it never opens a
+    window, needs no display and is not kept in pyplot's list of open figures
+    """
     if filename:
-        plt.savefig(filename)
+        from matplotlib.figure import Figure
+        return Figure(figsize=figsize, dpi=dpi)
+    import matplotlib.pyplot as plt
+    return plt.figure(figsize=figsize, dpi=dpi)
+
+
+def _finish_figure(fig, filename: str):
+    """
+    saves or shows `fig` and frees it, so repeated plotting does not keep every figure in memory
+    """
+    if filename:
+        fig.savefig(filename)
+        fig.clear()
     else:
+        import matplotlib.pyplot as plt
         plt.show()
+        plt.close(fig)
+
+
+def _plot_rows(labels: np.ndarray, mode: str, max_points: int, seed: int) -> (str, np.ndarray):
+    """
+    returns the drawing mode ("scatter" or "density") and the rows to draw (None for all of them)
+    """
+    if mode not in ("auto", "scatter", "sample", "density"):
+        raise ValueError("mode must be 'auto', 'scatter', 'sample' or 'density'.")
+    if not isinstance(max_points, int) or max_points <= 0:
+        raise ValueError("max_points must be a positive integer.")
+
+    n = len(labels)
+    if mode == "density":
+        return "density", None
+    if mode == "scatter" or n <= max_points:
+        return "scatter", None
+
+    #stratified sample: every cluster keeps its share of the points, and at least one point
+    rng = np.random.default_rng(seed)
+    clusters, inverse = np.unique(labels, return_inverse=True)
+    sizes = np.bincount(inverse)
+    #rows of every cluster in one shuffled order, grouped by cluster
+    order = np.argsort(inverse + rng.random(n), kind="stable")
+    starts = np.cumsum(sizes) - sizes
+    take = np.minimum(sizes, np.maximum(1, np.round(max_points * sizes / n).astype(int)))
+    rows = np.concatenate([order[start:start + count] for start, count in zip(starts, take)])
+    return "scatter", np.sort(rows)
+
+
+def _draw_panel(ax, mat: np.ndarray, values: np.ndarray, rows: np.ndarray, mode: str, cmap, kind: str):
+    """
+    draws the first two features of `mat` colored by `values` onto `ax` and returns the artist (for a colorbar)
+    """
+    if mode == "scatter":
+        if rows is not None:
+            mat, values = mat[rows], values[rows]
+        #tiny markers and no edges keep dense scatter plots readable
+        return ax.scatter(mat[:,0], mat[:,1], c=values, cmap=cmap, s=4 if len(values) > 5000 else None, linewidths=0)
+    return _draw_density(ax, mat, values, cmap, kind)
+
+
+def _draw_density(ax, mat: np.ndarray, values: np.ndarray, cmap, kind: str, gridsize: int = 200):
+    """
+    bins the points into a `gridsize` x `gridsize` grid with one np.bincount and draws it as an image.
+    for labels every bin shows its most common label, for values their mean. bins fade with fewer points.
+    the cost is O(n) for the binning and independent of n for the drawing.
+    """
+    x, y = mat[:, 0], mat[:, 1]
+    extent = [x.min(), x.max(), y.min(), y.max()]
+
+    def bin_index(coordinate, low, high):
+        width = (high - low) / gridsize or 1
+        return np.minimum(((coordinate - low) / width).astype(np.intp), gridsize - 1)
+
+    #bins as rows (y) x columns (x), the layout imshow expects
+    bins = bin_index(y, extent[2], extent[3]) * gridsize + bin_index(x, extent[0], extent[1])
+    counts = np.bincount(bins, minlength=gridsize**2)
+
+    if kind == "labels":
+        clusters, inverse = np.unique(values, return_inverse=True)
+        per_label = np.bincount(bins * len(clusters) + inverse, minlength=gridsize**2 * len(clusters))
+        image = clusters[np.argmax(per_label.reshape(gridsize**2, len(clusters)), axis=1)].astype(float)
+        vmin, vmax = clusters.min(), clusters.max()
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            image = np.bincount(bins, weights=values, minlength=gridsize**2) / counts
+        vmin, vmax = -1, 1 #silhouette scores
 
+    filled = counts > 0
+    image = np.ma.masked_array(image, mask=~filled).reshape(gridsize, gridsize)
+    #bins with more points are more opaque (log scale, the emptiest filled bin still shows)
+    log_counts = np.log1p(counts)
+    alpha = np.where(filled, 0.25 + 0.75 * log_counts / max(log_counts.max(), 1e-12), 0).reshape(gridsize, gridsize)
+    return ax.imshow(
+        image, extent=extent, origin="lower", aspect="auto", interpolation="nearest",
+        cmap=cmap, vmin=vmin, vmax=vmax, alpha=alpha)
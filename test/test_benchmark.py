@@ -0,0 +1,61 @@
+# unit tests for the benchmark harness
+import json
+import pytest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.benchmark import run_grid, compare, save_results, load_results, main
+
+TINY = {"n": [300, 600], "m": [2], "k": [3], "scale": [1.0]}
+
+#every case measures every operation and the results survive a json round trip
+def test_run_grid(tmp_path):
+    results = run_grid(TINY, repeat=1, silhouette_max_n=400)
+    assert len(results["cases"]) == 2
+    assert "numpy" in results["environment"]
+
+    small, large = results["cases"]
+    for operation in ("fit", "predict", "get_error", "silhouette"):
+        assert small[operation]["time"] >= 0
+        assert small[operation]["peak_memory"] >= 0
+    assert small["fit"]["n_iter"] >= 1
+    assert large["silhouette"] is None #above silhouette_max_n
+
+    path = str(tmp_path / "results.json")
+    save_results(results, path)
+    assert load_results(path) == json.loads(json.dumps(results))
+
+    with pytest.raises(ValueError):
+        run_grid("huge")
+
+#slower or larger measurements beyond the tolerance are reported
+def test_compare():
+    results = run_grid(TINY, repeat=1, silhouette_max_n=400)
+    assert compare(results, results) == []
+
+    slower = json.loads(json.dumps(results))
+    slower["cases"][0]["fit"]["time"] = max(results["cases"][0]["fit"]["time"], 1e-3) * 2
+    slower["cases"][1]["predict"]["peak_memory"] = results["cases"][1]["predict"]["peak_memory"] * 2 + 1
+    regressions = compare(slower, results, tolerance=0.5)
+    assert {(r["n"], r["operation"], r["metric"]) for r in regressions} == {
+        (300, "fit", "time"), (600, "predict", "peak_memory")}
+
+    #sub-millisecond noise is not a regression
+    noisy = json.loads(json.dumps(results))
+    noisy["cases"][0]["get_error"]["time"] = 5e-4
+    results["cases"][0]["get_error"]["time"] = 1e-6
+    assert compare(noisy, results) == []
+
+#the command line writes results and fails on regressions
+def test_main(tmp_path, monkeypatch):
+    import cluster.benchmark
+    monkeypatch.setitem(cluster.benchmark.GRIDS, "small", TINY)
+    path = str(tmp_path / "baseline.json")
+    assert main(["--repeat", "1", "--output", path]) == 0
+
+    baseline = load_results(path)
+    for case in baseline["cases"]:
+        case["predict"]["peak_memory"] = 0
+    save_results(baseline, path)
+    assert main(["--repeat", "1", "--baseline", path]) == 1
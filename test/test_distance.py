@@ -0,0 +1,42 @@
+# unit tests for the matrix product distance kernel
+import pytest
+import numpy as np
+from scipy.spatial.distance import cdist
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.distance import row_norms, squared_distances, euclidean_distances, error_bound, assign_labels
+
+#the expanded distances stay within the documented error bound, in float64 and float32
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_squared_distances_error_bound(dtype):
+    rng = np.random.default_rng(0)
+    X = (rng.normal(size=(500, 20)) * 10 + 50).astype(dtype)
+    C = (rng.normal(size=(30, 20)) * 10 + 50).astype(dtype)
+
+    exact = cdist(X.astype(np.float64), C.astype(np.float64), "sqeuclidean")
+    fast = squared_distances(X, C)
+    assert fast.dtype == dtype
+    assert np.all(np.abs(fast - exact) <= error_bound(row_norms(X), row_norms(C), 20, dtype)[:, None])
+    assert np.allclose(euclidean_distances(X, C), np.sqrt(exact), rtol=1e-3 if dtype == np.float32 else 1e-9)
+
+#results are written into a preallocated buffer
+def test_squared_distances_out():
+    X = np.array([[0.0, 0.0], [3.0, 4.0]])
+    out = np.empty((2, 1))
+    result = squared_distances(X, np.array([[0.0, 0.0]]), out=out)
+    assert result is out
+    assert np.array_equal(out, [[0.0], [25.0]])
+
+#near ties are recomputed exactly, so the labels always match cdist + argmin
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_assign_labels_near_ties(dtype):
+    rng = np.random.default_rng(1)
+    C = np.array([[1000.0, 0.0], [1000.0, 1e-3]])
+    #points almost exactly between the two centroids, far from the origin
+    X = np.column_stack([rng.normal(1000, 1, 2000), 5e-4 + rng.normal(0, 1e-5, 2000)]).astype(dtype)
+
+    labels, _ = assign_labels(X, C.astype(dtype))
+    expected = np.argmin(cdist(X.astype(np.float64), C.astype(dtype).astype(np.float64)), axis=1)
+    assert np.array_equal(labels, expected)
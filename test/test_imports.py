@@ -0,0 +1,59 @@
+# unit tests for the lazy imports of the package
+import pytest
+import subprocess
+import textwrap
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import cluster
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def run_fresh(code: str):
+    #a new interpreter, in this one pytest and the other tests have imported everything already
+    subprocess.run([sys.executable, "-c", textwrap.dedent(code)], cwd=ROOT, check=True)
+
+
+#importing the package and fitting a model does not load matplotlib or scipy
+def test_import_does_not_load_plotting():
+    run_fresh("""
+        import sys
+        import time
+        start = time.perf_counter()
+        import cluster
+        cluster.KMeans
+        elapsed = time.perf_counter() - start
+        assert "matplotlib" not in sys.modules, "matplotlib was imported"
+        assert "scipy" not in sys.modules, "scipy was imported"
+
+        import numpy as np
+        X = cluster.make_clusters(n=500, m=3, k=3, seed=0)[0]
+        model = cluster.KMeans(k=3)
+        model.fit(X)
+        model.predictor(index="gemm").predict(X)
+        assert "matplotlib" not in sys.modules, "matplotlib was imported"
+        print(f"import time {elapsed:.3f}s")
+    """)
+
+
+#plotting still loads matplotlib when it is used
+def test_plotting_loads_on_use(tmp_path):
+    run_fresh(f"""
+        import sys
+        import cluster
+        X, labels = cluster.make_clusters(n=200, m=2, k=2, seed=0)
+        cluster.plot_clusters(X, labels, filename={str(tmp_path / 'plot.png')!r})
+        assert "matplotlib" in sys.modules
+    """)
+    assert (tmp_path / "plot.png").exists()
+
+
+#the lazy names behave like normal module attributes
+def test_lazy_attributes():
+    from cluster.kmeans import KMeans
+    assert cluster.KMeans is KMeans
+    assert set(cluster.__all__) <= set(dir(cluster))
+    with pytest.raises(AttributeError):
+        cluster.NotAName
@@ -0,0 +1,87 @@
+# unit tests for saving / loading models and memory mapped inputs
+import pytest
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.kmeans import KMeans
+from cluster.silhouette import Silhouette
+from cluster.utils import make_clusters
+
+#a saved and loaded model is the same model, with its arrays memory mapped
+@pytest.mark.parametrize("init", ["k-means++", "array"])
+def test_save_load(tmp_path, init):
+    X, _ = make_clusters(n=500, m=3, k=4)
+    if init == "array":
+        init = X[:4].copy()
+    km = KMeans(k=4, init=init, dtype=np.float32)
+    km.fit(X)
+    km.save(tmp_path / "model")
+
+    loaded = KMeans.load(tmp_path / "model")
+    assert isinstance(loaded.centroids, np.memmap)
+    assert loaded.dtype == np.float32
+    assert np.array_equal(loaded.centroids, km.centroids)
+    assert np.array_equal(loaded.labels, km.labels)
+    assert np.array_equal(loaded.cluster_inertia_, km.cluster_inertia_)
+    assert loaded.inertia_ == km.inertia_
+    assert loaded.inertia_history_ == km.inertia_history_
+    assert loaded.get_error() == km.get_error()
+    assert np.array_equal(loaded.predict(X), km.predict(X))
+    if isinstance(init, np.ndarray):
+        assert np.array_equal(loaded.init, init)
+
+    #copy on write: partial_fit updates the loaded model but not the file
+    loaded.partial_fit(X[:50])
+    assert np.array_equal(KMeans.load(tmp_path / "model").centroids, km.centroids)
+
+    #read-only mapping refuses changes
+    frozen = KMeans.load(tmp_path / "model", mmap_mode="r")
+    with pytest.raises(ValueError):
+        frozen.partial_fit(X[:50])
+
+def test_save_load_errors(tmp_path):
+    with pytest.raises(ValueError):
+        KMeans(k=2).save(tmp_path / "model")
+    with pytest.raises(ValueError):
+        KMeans.load(tmp_path)
+
+#numpy scalar parameters are saved as plain numbers
+def test_save_numpy_params(tmp_path):
+    X, _ = make_clusters(n=200, m=2, k=3)
+    km = KMeans(k=3, tol=np.float64(1e-4), random_state=np.int64(3))
+    km.fit(X)
+    km.save(tmp_path / "model")
+    loaded = KMeans.load(tmp_path / "model")
+    assert loaded.random_state == 3 and type(loaded.random_state) is int
+    assert np.array_equal(loaded.centroids, km.centroids)
+
+    #a value json can not hold fails before any file is written
+    km.random_state = object()
+    with pytest.raises(ValueError):
+        km.save(tmp_path / "broken")
+    assert not (tmp_path / "broken").exists()
+
+#.npy paths and memmaps are used in place
+def test_npy_inputs(tmp_path):
+    X, _ = make_clusters(n=400, m=2, k=3)
+    path = str(tmp_path / "data.npy")
+    np.save(path, X)
+
+    km = KMeans(k=3)
+    km.fit(X)
+    from_path = KMeans(k=3)
+    from_path.fit(path)
+    assert np.array_equal(from_path.centroids, km.centroids)
+    assert np.array_equal(km.predict(path), km.labels)
+
+    mapped = np.load(path, mmap_mode="r")
+    assert np.array_equal(km.predict(mapped), km.labels)
+
+    np.save(tmp_path / "labels.npy", km.labels)
+    scores = Silhouette().score(path, str(tmp_path / "labels.npy"))
+    assert np.allclose(scores, Silhouette().score(X, km.labels))
+
+    with pytest.raises(ValueError):
+        km.predict(str(tmp_path / "data.csv"))
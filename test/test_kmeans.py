@@ -1,6 +1,7 @@
 # Write your k-means unit tests here
 import pytest 
 import numpy as np
+import time
 from cluster.kmeans import KMeans
 
 import sys
@@ -60,4 +61,401 @@ def test_kmeans_error():
 
     error = kmeans.get_error()
     assert isinstance(error, float)
-    assert error >= 0 #error should never be negative
\ No newline at end of file
+    assert error >= 0 #error should never be negative
+#elkan and hamerly skip distance computations but must end up exactly where lloyd does
+@pytest.mark.parametrize("algorithm", ["elkan", "hamerly"])
+def test_kmeans_bounded_algorithms_match_lloyd(algorithm):
+    from cluster.utils import make_clusters
+
+    for n, m, k, scale in [(2000, 2, 5, 1), (1500, 10, 12, 3), (300, 1, 3, 0.5)]:
+        X, _ = make_clusters(n=n, m=m, k=k, scale=scale)
+
+        lloyd = KMeans(k=k, max_iter=300)
+        lloyd.fit(X)
+        bounded = KMeans(k=k, max_iter=300, algorithm=algorithm)
+        bounded.fit(X)
+
+        assert np.array_equal(bounded.labels, lloyd.labels)
+        assert np.array_equal(bounded.centroids, lloyd.centroids)
+        assert bounded.n_distance_evals_ < lloyd.n_distance_evals_
+
+def test_kmeans_invalid_algorithm():
+    with pytest.raises(ValueError):
+        KMeans(k=2, algorithm="fast")
+
+#mini-batch and streamed fits should find the same clusters as a full fit
+def test_kmeans_minibatch_and_partial_fit(tmp_path):
+    #four centers at least 16 apart with noise of 0.5, whatever the random draws the clusters are separate.
+    #the rows come in random order, a stream should not see one cluster at a time
+    centers = 6 * np.array([[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]], dtype=float)
+    rng = np.random.default_rng(0)
+    truth = rng.integers(0, 4, 3000)
+    X = centers[truth] + rng.normal(scale=0.5, size=(3000, 3))
+    true_centers = np.array([X[truth == i].mean(axis=0) for i in range(4)])
+
+    #random batches from a matrix stored on disk
+    stored = np.lib.format.open_memmap(tmp_path / "X.npy", mode="w+", dtype=X.dtype, shape=X.shape)
+    stored[:] = X
+    #a streamed fit can not restart, a few seedings of the first batch keep two centroids out of one cluster
+    minibatch = KMeans(k=4, batch_size=256, n_init=3)
+    minibatch.fit(stored)
+    assert minibatch.labels.shape == (len(X),)
+
+    #chunks coming from a generator, nothing but one chunk is in memory at a time
+    streamed = KMeans(k=4, batch_size=100, n_init=3)
+    streamed.fit_batches(stored[start:start + 500] for start in range(0, len(X), 500))
+    assert streamed.get_centroids().shape == (4, 3)
+    assert streamed.labels is None
+
+    for model in [minibatch, streamed]:
+        #every true cluster center has a fitted centroid close by
+        gaps = np.linalg.norm(model.get_centroids()[:, None] - true_centers[None], axis=2)
+        assert np.all(gaps.min(axis=0) < 0.5)
+
+    #partial_fit keeps updating an existing model
+    streamed.partial_fit(X[:50])
+    with pytest.raises(ValueError):
+        streamed.partial_fit(X[:50, :2])
+    with pytest.raises(ValueError):
+        KMeans(k=4).partial_fit(X[:3])
+
+#the parallel fit adds up the shards in a fixed order, so the thread count never changes the result
+def test_kmeans_n_jobs_deterministic(monkeypatch):
+    import cluster.kmeans
+    from cluster.utils import make_clusters
+
+    #small shards so the test data is split over many of them
+    monkeypatch.setattr(cluster.kmeans, "_SHARD_SIZE", 97)
+    X, _ = make_clusters(n=2000, m=4, k=5, scale=1.5)
+
+    serial = KMeans(k=5, n_jobs=1)
+    serial.fit(X)
+    for n_jobs in [2, 3, 8]:
+        parallel = KMeans(k=5, n_jobs=n_jobs)
+        parallel.fit(X)
+        assert np.array_equal(parallel.centroids, serial.centroids)
+        assert np.array_equal(parallel.labels, serial.labels)
+
+    with pytest.raises(ValueError):
+        KMeans(k=5, n_jobs=0)
+
+#a cluster that loses all of its points must not end up with a nan centroid
+@pytest.mark.parametrize("empty_cluster", ["farthest", "keep"])
+def test_kmeans_empty_cluster(empty_cluster):
+    X = np.vstack([np.zeros((10, 2)), np.full((10, 2), 10.0), [[10.0, 11.0]]])
+    centroids = X[[0, 10, 20]]
+
+    #every point assigned to centroid 0 leaves centroids 1 and 2 empty
+    km = KMeans(k=3, empty_cluster=empty_cluster)
+    new = km._update_centroids(X, np.zeros(len(X), dtype=int), centroids, None)
+    assert not np.isnan(new).any()
+    if empty_cluster == "keep":
+        assert np.array_equal(new[1:], centroids[1:])
+    else:
+        #the points farthest from their centroid are taken, the farthest one first
+        assert np.array_equal(new[1], X[20])
+        assert np.array_equal(new[2], X[10])
+
+    km.fit(X)
+    assert not np.isnan(km.get_centroids()).any()
+
+#every init method finds the clusters, fits are reproducible and the global random state is left alone
+@pytest.mark.parametrize("init", ["k-means++", "k-means||", "random"])
+def test_kmeans_init_methods(init):
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=1000, m=2, k=5, scale=0.3)
+
+    np.random.seed(0)
+    expected_draw = np.random.random()
+    np.random.seed(0)
+    km = KMeans(k=5, init=init, n_init=4, random_state=7)
+    km.fit(X)
+    assert np.random.random() == expected_draw
+
+    again = KMeans(k=5, init=init, n_init=4, random_state=7)
+    again.fit(X)
+    assert np.array_equal(km.centroids, again.centroids)
+
+    #restarts in parallel pick the same run as restarts one after the other
+    parallel = KMeans(k=5, init=init, n_init=4, random_state=7, n_jobs=4)
+    parallel.fit(X)
+    assert np.array_equal(km.centroids, parallel.centroids)
+
+    #the kept restart is never worse than a single run with the same first seed
+    single = KMeans(k=5, init=init, n_init=1, random_state=7)
+    single.fit(X)
+    inertia = np.sum((X - km.centroids[km.labels]) ** 2)
+    assert inertia <= np.sum((X - single.centroids[single.labels]) ** 2) + 1e-9
+
+#k-means|| computes its distances in blocks, so seeding memory does not grow with n x k
+def test_kmeans_parallel_init_memory():
+    import tracemalloc
+    from cluster.kmeans import _kmeans_parallel
+
+    X = np.random.default_rng(0).normal(size=(40000, 2))
+    tracemalloc.start()
+    centroids = _kmeans_parallel(X, 200, np.random.default_rng(0))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert centroids.shape == (200, 2)
+    #a single 40000 x 400 round of candidates would already be 128MB
+    assert peak < 64 * 2**20
+
+def test_kmeans_init_array():
+    X = np.array([
+        [1,2], [1.5, 1.8], [5, 8],
+        [8, 8], [1, 0.6], [9, 11]
+    ])
+    km = KMeans(k=2, init=np.array([[1.0, 1.0], [8.0, 9.0]]))
+    km.fit(X)
+    assert np.array_equal(km.labels, [0, 0, 1, 1, 0, 1])
+
+    with pytest.raises(ValueError):
+        KMeans(k=3, init=np.array([[1.0, 1.0], [8.0, 9.0]]))
+    with pytest.raises(ValueError):
+        KMeans(k=2, init="farthest")
+    with pytest.raises(ValueError):
+        KMeans(k=2, n_init=0)
+
+#float32 keeps everything in single precision and finds the same clusters
+def test_kmeans_float32():
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=2000, m=5, k=4, scale=1)
+    double = KMeans(k=4)
+    double.fit(X)
+    single = KMeans(k=4, dtype=np.float32)
+    single.fit(X)
+
+    assert single.centroids.dtype == np.float32
+    assert single._own_distances.dtype == np.float32
+    assert np.array_equal(single.labels, double.labels)
+    assert np.allclose(single.centroids, double.centroids, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        KMeans(k=4, dtype=np.int64)
+
+#with a workspace the iterations allocate nothing that grows, so peak memory does not depend on max_iter
+def test_kmeans_workspace_flat_memory():
+    import tracemalloc
+    from cluster.kmeans import KMeansWorkspace
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=20000, m=8, k=10, scale=3)
+    workspace = KMeansWorkspace(n_samples=20000, k=10, n_features=8)
+
+    peaks = {}
+    for max_iter in [3, 30]:
+        km = KMeans(k=10, max_iter=max_iter, tol=0)
+        tracemalloc.start()
+        km.fit(X, workspace=workspace)
+        peaks[max_iter] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert peaks[30] <= peaks[3] * 1.05
+
+    #the same workspace serves smaller k and the results are copied out of it
+    small = KMeans(k=4)
+    small.fit(X, workspace=workspace)
+    reference = KMeans(k=4)
+    reference.fit(X)
+    assert np.array_equal(small.labels, reference.labels)
+    assert np.array_equal(small.centroids, reference.centroids)
+    km.fit(X[:100], workspace=workspace)
+    assert np.array_equal(small.labels, reference.labels)
+
+    with pytest.raises(ValueError):
+        KMeans(k=11).fit(X, workspace=workspace)
+    with pytest.raises(ValueError):
+        KMeans(k=4, dtype=np.float32).fit(X, workspace=workspace)
+
+#precomputed row norms give the same fit, and k-means++ can continue from known distances
+def test_kmeans_workspace_norms_and_warm_seeding():
+    from cluster.kmeans import KMeansWorkspace, _kmeans_plusplus
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=2000, m=4, k=6, scale=1, seed=3)
+    workspace = KMeansWorkspace(n_samples=2000, k=6, n_features=4)
+    workspace.precompute_norms(X)
+    km = KMeans(k=6)
+    km.fit(X, workspace=workspace)
+    reference = KMeans(k=6)
+    reference.fit(X)
+    assert np.array_equal(km.centroids, reference.centroids)
+    with pytest.raises(ValueError):
+        workspace.precompute_norms(X[:, :3])
+
+    #the fit's own distances stand in for the distances to its centroids
+    small = KMeans(k=3)
+    small.fit(X)
+    assert small.converged_
+    known = _kmeans_plusplus(
+        X, 6, np.random.default_rng(0), centroids=small.centroids, closest_sq=small._own_distances ** 2)
+    computed = _kmeans_plusplus(X, 6, np.random.default_rng(0), centroids=small.centroids)
+    assert np.array_equal(known[:3], small.centroids)
+    assert np.allclose(known, computed)
+
+#the recorded inertia is the exact within-cluster sum of squares, also when max_iter cuts the fit short
+@pytest.mark.parametrize("algorithm", ["lloyd", "elkan", "hamerly"])
+@pytest.mark.parametrize("max_iter", [1, 3, 300])
+def test_kmeans_inertia(algorithm, max_iter):
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=1000, m=3, k=4, scale=2)
+
+    km = KMeans(k=4, algorithm=algorithm, max_iter=max_iter, init="random")
+    km.fit(X)
+
+    own = np.sum((X - km.centroids[km.labels]) ** 2, axis=1)
+    assert np.allclose(km.cluster_inertia_, np.bincount(km.labels, weights=own, minlength=4))
+    assert np.isclose(km.inertia_, own.sum())
+    assert km.get_error() == pytest.approx(own.mean())
+
+    #lloyd never increases the inertia
+    assert len(km.inertia_history_) <= max_iter
+    assert all(a >= b - 1e-9 for a, b in zip(km.inertia_history_, km.inertia_history_[1:]))
+    assert km.inertia_ <= km.inertia_history_[-1] + 1e-9
+
+def test_kmeans_minibatch_inertia():
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=2000, m=2, k=3)
+
+    km = KMeans(k=3, batch_size=200, max_iter=20)
+    km.fit(X)
+    own = np.sum((X - km.centroids[km.labels]) ** 2, axis=1)
+    assert np.isclose(km.inertia_, own.sum())
+    assert 0 < len(km.inertia_history_) <= 20
+
+    with pytest.raises(ValueError):
+        KMeans(k=3).get_error()
+
+    #partial_fit moves the centroids, the inertia of the fit no longer applies
+    km.partial_fit(X[:100])
+    assert km.inertia_ is None and km.cluster_inertia_ is None
+    with pytest.raises(ValueError, match="No inertia was recorded"):
+        km.get_error()
+
+    #a streamed fit is fitted (predict works) but records no inertia
+    streamed = KMeans(k=3, batch_size=500)
+    streamed.fit_batches([X[:1000], X[1000:]])
+    streamed.predict(X)
+    with pytest.raises(ValueError, match="No inertia was recorded"):
+        streamed.get_error()
+
+#mini-batch and streamed fits seed their first batch n_init times and keep the best seeding
+def test_kmeans_minibatch_n_init():
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=3000, m=3, k=8, scale=0.5, seed=0)
+
+    first_inertia = {}
+    for n_init in (1, 5):
+        calls = []
+        KMeans(k=8, batch_size=256, max_iter=5, n_init=n_init, callback=calls.append).fit(X)
+        #the first batch is the one that was seeded, its inertia before the first update is the seeding's
+        first_inertia[n_init] = calls[0]["inertia"]
+    #the seedings of n_init=5 start with the one of n_init=1, the kept one is never worse
+    assert first_inertia[5] <= first_inertia[1]
+
+    streamed = KMeans(k=8, batch_size=256, n_init=5)
+    streamed.partial_fit(X[:500])
+    single = KMeans(k=8, batch_size=256)
+    single.partial_fit(X[:500])
+    #the seeding costs a distance pass over the batch per try, plus the pass of partial_fit itself
+    assert streamed.n_distance_evals_ == 6 * 500 * 8
+    assert single.n_distance_evals_ == 500 * 8
+
+#the callback sees every iteration, the counters on the model agree with it
+@pytest.mark.parametrize("algorithm", ["lloyd", "elkan", "hamerly"])
+def test_kmeans_callback(algorithm):
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=1000, m=2, k=4, scale=2)
+
+    calls = []
+    km = KMeans(k=4, algorithm=algorithm, init="random", callback=calls.append)
+    km.fit(X)
+
+    assert km.converged_
+    assert km.n_iter_ == len(calls) == len(km.inertia_history_)
+    assert [call["iteration"] for call in calls] == list(range(km.n_iter_))
+    assert [call["inertia"] for call in calls] == km.inertia_history_
+    assert calls[0]["n_changed"] == len(X)
+    assert calls[-1]["n_changed"] == 0 and calls[-1]["converged"]
+    assert all(call["shift"] >= call["max_shift"] >= 0 for call in calls)
+    assert set(km.timings_) == {"init", "assign", "update"}
+    assert km.timings_["assign"] == pytest.approx(sum(call["assign_time"] for call in calls))
+
+    #hitting max_iter is reported and the callback does not change the result
+    short = KMeans(k=4, algorithm=algorithm, init="random", max_iter=2)
+    short.fit(X)
+    assert not short.converged_ and short.n_iter_ == 2
+    plain = KMeans(k=4, algorithm=algorithm, init="random")
+    plain.fit(X)
+    assert np.array_equal(km.centroids, plain.centroids)
+
+    with pytest.raises(ValueError):
+        KMeans(k=4, callback="print")
+
+def test_kmeans_callback_restarts_minibatch():
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=1000, m=2, k=3)
+
+    calls = []
+    KMeans(k=3, n_init=3, n_jobs=2, callback=calls.append).fit(X)
+    assert {call["restart"] for call in calls} == {0, 1, 2}
+
+    calls = []
+    km = KMeans(k=3, batch_size=100, max_iter=10, callback=calls.append)
+    start = time.perf_counter()
+    km.fit(X)
+    elapsed = time.perf_counter() - start
+    assert len(calls) == km.n_iter_ <= 10
+    assert calls[0]["n_changed"] is None
+    #every phase took a real, non-negative part of the fit
+    assert set(km.timings_) == {"init", "assign", "update"}
+    assert all(0 <= value <= elapsed for value in km.timings_.values())
+
+#every convergence mode stops on its own criterion and ends up at (nearly) the same clustering
+def test_kmeans_convergence_modes():
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=3000, m=5, k=6, scale=3)
+
+    calls = []
+    full = KMeans(k=6, tol=0, max_iter=500, convergence="labels", callback=calls.append)
+    full.fit(X)
+    assert full.converged_
+    assert calls[-1]["n_changed"] == 0 and calls[-2]["n_changed"] > 0
+
+    for convergence, tol in [("shift", 1e-6), ("scaled_shift", 1e-4), ("inertia", 1e-4)]:
+        km = KMeans(k=6, tol=tol, max_iter=500, convergence=convergence)
+        km.fit(X)
+        assert km.converged_
+        assert km.n_iter_ <= full.n_iter_
+        assert km.inertia_ == pytest.approx(full.inertia_, rel=1e-3)
+
+    #scaled_shift does not depend on the units of the data
+    small = KMeans(k=6, tol=1e-4, convergence="scaled_shift")
+    small.fit(X)
+    large = KMeans(k=6, tol=1e-4, convergence="scaled_shift")
+    large.fit(X * 1000)
+    assert small.n_iter_ == large.n_iter_
+
+    with pytest.raises(ValueError):
+        KMeans(k=6, convergence="never")
+    with pytest.raises(ValueError):
+        KMeans(k=6, batch_size=100, convergence="labels")
+
+#moving only the changed points between the cluster sums gives the same fit as recomputing them
+@pytest.mark.parametrize("empty_cluster", ["farthest", "keep"])
+def test_kmeans_incremental_update(monkeypatch, empty_cluster):
+    import cluster.kmeans
+    from cluster.utils import make_clusters
+    X, _ = make_clusters(n=2000, m=3, k=8, scale=4)
+
+    incremental = KMeans(k=8, init="random", max_iter=200, empty_cluster=empty_cluster)
+    incremental.fit(X)
+    monkeypatch.setattr(cluster.kmeans, "_INCREMENTAL_MAX_FRACTION", 0)
+    recomputed = KMeans(k=8, init="random", max_iter=200, empty_cluster=empty_cluster)
+    recomputed.fit(X)
+
+    assert np.array_equal(incremental.labels, recomputed.labels)
+    assert np.allclose(incremental.centroids, recomputed.centroids, rtol=0, atol=1e-9)
+    assert incremental.n_iter_ == recomputed.n_iter_
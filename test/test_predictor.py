@@ -0,0 +1,137 @@
+# unit tests for the frozen centroid predictor
+import pytest
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.kmeans import KMeans
+from cluster.predictor import KMeansPredictor
+from scipy.spatial.distance import cdist
+
+#both indexes give the labels of a brute force search, in batches and one row at a time
+@pytest.mark.parametrize("index", ["kdtree", "gemm"])
+@pytest.mark.parametrize("n_features", [2, 20])
+def test_predictor_matches_brute_force(index, n_features):
+    rng = np.random.default_rng(0)
+    centroids = rng.normal(size=(300, n_features))
+    X = rng.normal(size=(2000, n_features))
+    expected = np.argmin(cdist(X, centroids), axis=1)
+
+    predictor = KMeansPredictor(centroids, index=index)
+    assert predictor.index == index
+    assert np.array_equal(predictor.predict(X), expected)
+    assert [predictor.predict_one(x) for x in X[:50]] == list(expected[:50])
+
+#batches larger than one block of the gemm index
+def test_predictor_blocks(monkeypatch):
+    import cluster.predictor
+    monkeypatch.setattr(cluster.predictor, "_BLOCK_ELEMENTS", 1000)
+    rng = np.random.default_rng(1)
+    centroids = rng.normal(size=(64, 5))
+    X = rng.normal(size=(1001, 5))
+
+    predictor = KMeansPredictor(centroids, index="gemm")
+    assert np.array_equal(predictor.predict(X), np.argmin(cdist(X, centroids), axis=1))
+
+#the predictor is a snapshot that cannot be changed
+def test_predictor_frozen():
+    centroids = np.array([[0.0, 0.0], [10.0, 10.0]])
+    predictor = KMeansPredictor(centroids)
+    centroids[0] = 100
+    assert predictor.predict_one(np.array([1.0, 1.0])) == 0
+
+    with pytest.raises(AttributeError):
+        predictor.k = 3
+    with pytest.raises(AttributeError):
+        predictor.extra = 1
+    with pytest.raises(ValueError):
+        predictor.centroids[0, 0] = 1
+    with pytest.raises(ValueError):
+        predictor.predict(np.zeros((3, 3)))
+    with pytest.raises(ValueError):
+        predictor.predict_one(np.zeros(3))
+    with pytest.raises(ValueError):
+        KMeansPredictor(centroids, index="balltree")
+
+#KMeans.predict and the predictor agree with the labels of the fit
+def test_kmeans_predictor():
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(500, 3))
+    kmeans = KMeans(k=4)
+    kmeans.fit(X)
+
+    assert np.array_equal(kmeans.predict(X), kmeans.labels)
+    assert np.array_equal(kmeans.predictor().predict(X), kmeans.labels)
+    with pytest.raises(ValueError):
+        KMeans(k=4).predictor()
+
+    #the index is built once and reused by predict until the centroids change
+    cached = kmeans.predictor()
+    assert kmeans.predictor() is cached
+    kmeans.partial_fit(X[:100] + 5)
+    assert kmeans.predictor() is not cached
+    expected = np.argmin(((X[:, None, :] - kmeans.centroids[None]) ** 2).sum(axis=2), axis=1)
+    assert np.array_equal(kmeans.predict(X), expected)
+    #a predictor that was handed out keeps its snapshot
+    assert np.array_equal(cached.predict(X), kmeans.labels)
+
+    cached = kmeans.predictor()
+    kmeans.fit(X + 1)
+    assert kmeans.predictor() is not cached
+    assert np.array_equal(kmeans.predict(X + 1), kmeans.labels)
+
+    #centroids set or edited by hand are honoured as well
+    kmeans.centroids = X[:4].copy()
+    assert np.array_equal(kmeans.predict(X[:4]), np.arange(4))
+    kmeans.centroids[0] = X[10]
+    assert kmeans.predict(X[10:11])[0] == 0
+    kmeans.centroids = X[:2].copy()
+    assert set(kmeans.predict(X)) <= {0, 1}
+
+#chunked labelling gives the same result as one predict over all the data
+def test_predict_iter(tmp_path):
+    rng = np.random.default_rng(3)
+    X = rng.normal(size=(1000, 4))
+    kmeans = KMeans(k=5)
+    kmeans.fit(X)
+
+    chunks = [X[start:start + 300] for start in range(0, len(X), 300)]
+    labels = list(kmeans.predict_iter(chunks))
+    assert [len(part) for part in labels] == [300, 300, 300, 100]
+    assert np.array_equal(np.concatenate(labels), kmeans.labels)
+
+    #paths of .npy files and memmap slices are read on the background thread
+    paths = []
+    for i, chunk in enumerate(chunks):
+        paths.append(str(tmp_path / f"chunk{i}.npy"))
+        np.save(paths[-1], chunk)
+    mapped = np.load(paths[0], mmap_mode="r")
+    results = list(kmeans.predict_iter(paths[1:] + [mapped], return_distances=True, prefetch_depth=2))
+    assert np.array_equal(np.concatenate([part for part, _ in results]), np.roll(kmeans.labels, -300))
+    assert np.allclose(results[0][1], cdist(chunks[1], kmeans.centroids))
+
+    distances = np.concatenate(list(kmeans.transform_iter(chunks)))
+    assert np.allclose(distances, cdist(X, kmeans.centroids))
+
+def test_predict_iter_errors():
+    predictor = KMeansPredictor(np.zeros((2, 3)))
+
+    #stopping early stops the reader
+    def endless():
+        while True:
+            yield np.zeros((10, 3))
+    stream = predictor.predict_iter(endless())
+    assert len(next(stream)) == 10
+    stream.close()
+
+    #errors of the reader and of the data show up in the caller
+    def broken():
+        yield np.zeros((10, 3))
+        raise IOError("disk gone")
+    with pytest.raises(IOError):
+        list(predictor.predict_iter(broken()))
+    with pytest.raises(ValueError):
+        list(predictor.predict_iter([np.zeros((10, 2))]))
+    with pytest.raises(ValueError):
+        list(predictor.predict_iter([], prefetch_depth=0))
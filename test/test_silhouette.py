@@ -57,3 +57,163 @@ def test_silhouette_single_cluster():
 
     #Silhouette score should be 0 if all points are in the same cluster
     assert all(s == 0 for s in scores)
+
+#blocked scoring has to give the same result no matter how many rows are held in memory
+def test_silhouette_blocked_matches_full():
+    from sklearn.metrics import silhouette_samples
+    from cluster.utils import make_clusters
+
+    X, y = make_clusters(n=300, k=4, scale=1.5)
+
+    full_scores = Silhouette(block_size=len(X)).score(X, y)
+    for block_size in [1, 7, 64]:
+        blocked_scores = Silhouette(block_size=block_size).score(X, y)
+        assert np.allclose(blocked_scores, full_scores, rtol=0, atol=1e-12)
+
+    #max_memory small enough to force blocks of a few rows
+    assert np.allclose(Silhouette(max_memory=len(X) * 8 * 5).score(X, y), full_scores, rtol=0, atol=1e-12)
+    assert np.allclose(full_scores, silhouette_samples(X, y))
+
+def test_silhouette_block_size_validation():
+    with pytest.raises(ValueError):
+        Silhouette(block_size=0)
+    with pytest.raises(ValueError):
+        Silhouette(max_memory=-1)
+
+#a point that is alone in its cluster scores 0, like in sklearn
+def test_silhouette_singleton_cluster():
+    from sklearn.metrics import silhouette_samples
+
+    X = np.array([
+        [1, 2], [1.5, 1.8], [5, 8],
+        [8, 8], [1, 0.6], [30, 30]
+    ])
+    y = np.array([1, 1, 0, 0, 1, 2]) #point 5 is its own cluster
+
+    scores = Silhouette().score(X, y)
+    assert scores[5] == 0
+    assert np.allclose(scores, silhouette_samples(X, y))
+
+#the sampled estimate should be reproducible and close to the exact mean score
+def test_silhouette_score_sample():
+    from cluster.utils import make_clusters
+
+    X, y = make_clusters(n=2000, k=4, scale=2)
+    exact = np.mean(Silhouette().score(X, y))
+
+    silhouette = Silhouette()
+    estimate, (low, high) = silhouette.score_sample(X, y, n_samples=400, seed=0)
+    assert low <= estimate <= high
+    assert abs(estimate - exact) < 0.05
+    assert silhouette.score_sample(X, y, n_samples=400, seed=0) == (estimate, (low, high))
+
+    #per-cluster subsampled reference points
+    estimate, (low, high) = silhouette.score_sample(X, y, n_samples=400, n_reference=200, seed=0)
+    assert low <= estimate <= high
+    assert abs(estimate - exact) < 0.05
+
+    #sampling every point against all of X is the exact score
+    estimate, _ = silhouette.score_sample(X, y, n_samples=len(X), seed=1)
+    assert np.isclose(estimate, exact)
+
+    with pytest.raises(ValueError):
+        silhouette.score_sample(X, y, confidence=1.5)
+
+#the bootstrap resamples in blocks, so its memory does not grow with n_bootstrap
+def test_silhouette_score_sample_bootstrap_memory():
+    import tracemalloc
+    from cluster.utils import make_clusters
+
+    X, y = make_clusters(n=20000, k=4, seed=0)
+    peaks = []
+    for n_bootstrap in (1, 2000):
+        tracemalloc.start()
+        Silhouette().score_sample(X, y, n_samples=10000, n_reference=200, n_bootstrap=n_bootstrap, seed=0)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    #2000 x 10000 resampled indices alone would be 160MB
+    assert peaks[1] < peaks[0] + 20 * 2**20
+
+#a memory mapped X is read chunk by chunk, never copied into memory as a whole
+def test_silhouette_memmap_not_copied(tmp_path):
+    import tracemalloc
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(8000, 256))
+    y = rng.integers(0, 4, len(X))
+    path = str(tmp_path / "X.npy")
+    np.save(path, X)
+    expected = Silhouette().score(X, y)
+
+    silhouette = Silhouette(max_memory=2**22)
+    tracemalloc.start()
+    scores = silhouette.score(path, y)
+    silhouette.score_sample(path, y, n_samples=500, seed=0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert np.allclose(scores, expected)
+    #less than a single copy of X (16MB), the distances of a block take 4MB of that
+    assert peak < X.nbytes * 0.75
+
+#simplified silhouette from a fitted KMeans reuses the distances of the fit
+def test_silhouette_simplified():
+    from cluster.kmeans import KMeans
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=500, k=3, scale=0.5)
+    km = KMeans(k=3)
+    km.fit(X)
+
+    silhouette = Silhouette()
+    from_model = silhouette.score_simplified(kmeans=km)
+
+    #brute force reference from the definition
+    d = np.linalg.norm(X[:, None, :] - km.centroids[None, :, :], axis=2)
+    a = d[np.arange(len(X)), km.labels]
+    d[np.arange(len(X)), km.labels] = np.inf
+    b = d.min(axis=1)
+    expected = (b - a) / np.maximum(a, b)
+
+    assert np.allclose(silhouette.score_simplified(X, km.labels, centroids=km.centroids), expected)
+    #the fit converged, so the stored distances belong to the final centroids
+    assert np.allclose(from_model, expected)
+    assert np.all((from_model >= -1) & (from_model <= 1))
+    #well separated clusters score high
+    assert np.mean(from_model) > 0.5
+
+    with pytest.raises(ValueError):
+        silhouette.score_simplified(X)
+
+    #the model only keeps two distances per point, not the n x k matrix
+    assert km._own_distances.shape == km._other_distances.shape == (len(X),)
+    #partial_fit moves the centroids, the distances of the fit are stale then and dropped
+    km.partial_fit(X[:50])
+    with pytest.raises(ValueError):
+        silhouette.score_simplified(kmeans=km)
+
+#a fit cut short by max_iter moved its centroids after the last assignment, the scores follow the final centroids
+def test_silhouette_simplified_max_iter():
+    from cluster.kmeans import KMeans
+    from cluster.utils import make_clusters
+
+    X, _ = make_clusters(n=1000, m=3, k=5, scale=3, seed=1)
+    km = KMeans(k=5, max_iter=1, init="random")
+    km.fit(X)
+    assert not km.converged_
+
+    silhouette = Silhouette()
+    expected = silhouette.score_simplified(X, km.labels, centroids=km.centroids)
+    #no stale distances are kept, the model path needs the data then
+    assert km._own_distances is None
+    with pytest.raises(ValueError):
+        silhouette.score_simplified(kmeans=km)
+    assert np.allclose(silhouette.score_simplified(X, km.labels, kmeans=km), expected)
+
+#float32 scores agree with float64 to single precision accuracy
+def test_silhouette_float32():
+    from cluster.utils import make_clusters
+
+    X, y = make_clusters(n=1000, k=3, scale=2)
+    double = Silhouette().score(X, y)
+    single = Silhouette(dtype=np.float32).score(X, y)
+    assert np.allclose(single, double, atol=1e-4)
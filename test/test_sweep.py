@@ -0,0 +1,56 @@
+# unit tests for the k sweep
+import pytest
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.sweep import KMeansSweep, select_k
+from cluster.silhouette import Silhouette
+from cluster.utils import make_clusters
+
+#the sweep finds the true number of well separated clusters
+@pytest.mark.parametrize("warm_start", [True, False])
+@pytest.mark.parametrize("silhouette", ["sampled", "simplified", "exact"])
+def test_sweep_finds_k(warm_start, silhouette):
+    X, _ = make_clusters(n=1500, m=3, k=5, scale=0.5, seed=40)
+
+    sweep = KMeansSweep(range(2, 9), silhouette=silhouette, warm_start=warm_start, n_jobs=2).fit(X)
+    assert sweep.best_k() == 5
+    assert sorted(sweep.results) == list(range(2, 9))
+    for k, result in sweep.results.items():
+        assert sweep.models[k].k == k
+        assert result["inertia"] > 0
+        assert result["fit_time"] >= 0 and result["score_time"] >= 0
+
+    #inertia only goes down when k goes up, warm starts keep the old centroids
+    inertia = [sweep.results[k]["inertia"] for k in range(2, 9)]
+    if warm_start:
+        assert all(a >= b for a, b in zip(inertia, inertia[1:]))
+
+#the shared sampled silhouette matches the exact score when every point is sampled
+def test_sweep_sampled_silhouette_exact_when_complete():
+    X, _ = make_clusters(n=400, m=2, k=3, scale=1.5)
+
+    sweep = KMeansSweep([2, 3, 4], n_samples=400, n_reference=None).fit(X)
+    for k, model in sweep.models.items():
+        exact = np.mean(Silhouette().score(X, model.labels))
+        assert np.isclose(sweep.results[k]["silhouette"], exact)
+
+def test_select_k():
+    X, _ = make_clusters(n=1000, m=2, k=4, scale=0.3)
+    k, results = select_k(X, range(2, 7), criterion="inertia", max_iter=50)
+    assert k == 4
+    assert set(results) == set(range(2, 7))
+
+    with pytest.raises(ValueError):
+        KMeansSweep([])
+    with pytest.raises(ValueError):
+        KMeansSweep([2, 3], silhouette="full")
+    with pytest.raises(ValueError):
+        KMeansSweep([2, 3], algorithm="fast")
+    with pytest.raises(ValueError):
+        KMeansSweep([2, 3], n_jobs=0)
+
+    #-1 uses all cores, like KMeans
+    assert KMeansSweep([2, 3], n_jobs=-1).n_jobs == os.cpu_count()
@@ -0,0 +1,79 @@
+# unit tests for the clustered data generator
+import pytest
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from cluster.utils import make_clusters, iter_clusters, plot_clusters, plot_multipanel
+
+#the data only depends on the seed and shape, not on how it is produced
+def test_make_clusters_chunks_and_memmap(tmp_path, monkeypatch):
+    import cluster.utils
+    #small noise blocks so chunks start and end inside of them
+    monkeypatch.setattr(cluster.utils, "_BLOCK_ELEMENTS", 300)
+
+    X, labels = make_clusters(n=1000, m=4, k=5, seed=3)
+    assert X.shape == (1000, 4) and labels.shape == (1000,)
+    assert np.all(np.diff(labels) >= 0) #ordered by cluster
+    assert set(labels) == set(range(5))
+
+    chunks = list(iter_clusters(n=1000, m=4, k=5, seed=3, chunk_size=77))
+    assert max(len(chunk) for chunk, _ in chunks) == 77
+    assert np.array_equal(np.vstack([chunk for chunk, _ in chunks]), X)
+    assert np.array_equal(np.concatenate([part for _, part in chunks]), labels)
+
+    mapped, _ = make_clusters(n=1000, m=4, k=5, seed=3, path=str(tmp_path / "X.npy"))
+    assert isinstance(mapped, np.memmap)
+    assert np.array_equal(np.load(tmp_path / "X.npy"), X)
+
+    X32, _ = make_clusters(n=1000, m=4, k=5, seed=3, dtype=np.float32)
+    assert X32.dtype == np.float32 and np.allclose(X32, X, atol=1e-4)
+
+#a local generator: same seed same data, the global random state is left alone
+def test_make_clusters_seed():
+    np.random.seed(0)
+    before = np.random.get_state()[1].copy()
+    X, _ = make_clusters(n=200, seed=7)
+    assert np.array_equal(np.random.get_state()[1], before)
+
+    assert np.array_equal(make_clusters(n=200, seed=7)[0], X)
+    assert not np.array_equal(make_clusters(n=200, seed=8)[0], X)
+
+    #the points spread around their cluster center with the given scale
+    X, labels = make_clusters(n=20000, m=2, k=2, scale=0.5)
+    spread = np.concatenate([X[labels == i] - X[labels == i].mean(axis=0) for i in range(2)])
+    assert spread.std() == pytest.approx(0.5, rel=0.05)
+
+    with pytest.raises(ValueError):
+        make_clusters(n=2, k=3)
+    with pytest.raises(ValueError):
+        list(iter_clusters(chunk_size=0))
+
+#every mode renders to a file without leaving a figure open
+@pytest.mark.parametrize("mode", ["auto", "scatter", "sample", "density"])
+def test_plots_headless(tmp_path, mode):
+    import matplotlib.pyplot as plt
+    X, labels = make_clusters(n=3000, k=3)
+    scores = np.linspace(-1, 1, len(X))
+
+    plot_clusters(X, labels, filename=str(tmp_path / "clusters.png"), mode=mode, max_points=500, dpi=50)
+    plot_multipanel(X, labels, labels, scores, filename=str(tmp_path / "multi.png"), mode=mode, max_points=500, dpi=50)
+    assert (tmp_path / "clusters.png").stat().st_size > 0
+    assert (tmp_path / "multi.png").stat().st_size > 0
+    assert plt.get_fignums() == []
+
+    with pytest.raises(ValueError):
+        plot_clusters(X, labels, filename=str(tmp_path / "x.png"), mode="hexagons")
+
+#the sample keeps every cluster, even one much smaller than the others
+def test_plot_sample_stratified():
+    from cluster.utils import _plot_rows
+    labels = np.repeat([0, 1, 2], [100000, 50000, 3])
+
+    mode, rows = _plot_rows(labels, "auto", 1000, seed=0)
+    assert mode == "scatter"
+    assert len(rows) <= 1003 and len(np.unique(rows)) == len(rows)
+    assert np.array_equal(np.bincount(labels[rows]), [667, 333, 1])
+    assert np.array_equal(_plot_rows(labels, "auto", 1000, seed=0)[1], rows)
+    assert _plot_rows(labels, "auto", 10**6, seed=0)[1] is None